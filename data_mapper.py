@@ -1,82 +1,1810 @@
 import pandas as pd
-from typing import Dict, Any, List
+import numpy as np
+from typing import Dict, Any, List, Callable, Iterable, Iterator, Optional, Pattern, Tuple, Union
+import io
 import os
-from collections import defaultdict
+import sys
+import glob
+import pickle
+import hashlib
+import zipfile
+import re
+import operator
+import functools
+import argparse
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from openpyxl import Workbook, load_workbook
 
 def validate_excel_file(file_path: str) -> bool:
     """Validate if the file is a valid Excel file"""
     return file_path.endswith(('.xlsx', '.xls', '.xlsm'))
 
-def perform_data_mapping(input_file: str, mapping_file: str, output_file: str) -> None:
+# File extension -> output format written by write_output(); read_input() reads the same formats
+OUTPUT_FORMATS = {
+    '.xlsx': 'excel',
+    '.xlsm': 'excel',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.ipc': 'feather',
+    '.csv': 'csv',
+}
+
+# Compression suffixes pandas infers for CSV files (e.g. output.csv.gz)
+CSV_COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.zip', '.xz', '.zst', '.tar')
+
+def output_format(file_path: str) -> str:
+    """Determine the output format ('excel', 'parquet', 'feather' or 'csv') from the file extension"""
+    return _format_from_extension(file_path, 'output')
+
+def input_format(file_path: str) -> str:
+    """Determine the input format ('excel', 'parquet', 'feather' or 'csv') from the file extension"""
+    return _format_from_extension(file_path, 'input')
+
+def _format_from_extension(file_path: str, kind: str) -> str:
+    root, ext = os.path.splitext(file_path.lower())
+    if ext in CSV_COMPRESSION_SUFFIXES and root.endswith('.csv'):
+        ext = '.csv'
+    if ext not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported {kind} file format: {file_path}")
+    return OUTPUT_FORMATS[ext]
+
+MAPPING_COLUMNS = ('source_field', 'target_field', 'transform_rule')
+
+# Rows per chunk when streaming large workbooks
+DEFAULT_CHUNK_SIZE = 50000
+
+def read_excel_chunks(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, sheet_name: Union[str, int] = 0,
+                      columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Stream an Excel sheet as DataFrames of at most chunk_size rows
+
+    Uses openpyxl's read-only row iterator, so only one chunk is held in
+    memory at a time. The first row is the header; the chunk index
+    continues across chunks like a single pd.read_excel would.
+
+    Args:
+        file_path (str): Path to Excel file
+        chunk_size (int): Maximum number of rows per chunk
+        sheet_name (str or int): Sheet name or index to read
+        columns (list, optional): Only keep these columns; missing names are ignored
+    Returns:
+        Iterator[DataFrame]: Row chunks; a sheet with no data rows yields one empty chunk
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        names = _header_names(header)
+        if columns is None:
+            positions = list(range(len(names)))
+        else:
+            wanted = set(columns)
+            positions = [i for i, name in enumerate(names) if name in wanted]
+        names = [names[i] for i in positions]
+
+        start = 0
+        buffer = []
+        pending_empty = []
+        for row in rows:
+            # Blank rows are only kept when followed by data, matching pd.read_excel
+            if all(value is None for value in row):
+                pending_empty.append(row)
+                continue
+            buffer.extend(pending_empty)
+            pending_empty = []
+            buffer.append(row)
+            while len(buffer) >= chunk_size:
+                chunk, buffer = buffer[:chunk_size], buffer[chunk_size:]
+                yield _rows_to_frame(chunk, names, positions, start)
+                start += len(chunk)
+        if buffer or start == 0:
+            yield _rows_to_frame(buffer, names, positions, start)
+    finally:
+        workbook.close()
+
+def _header_names(header: tuple) -> List[Any]:
+    """
+    Column names from a header row, deduplicated the way pd.read_excel does
+
+    Blank cells become "Unnamed: <position>". A repeated name gets the first
+    free ".1", ".2", ... suffix that is not already a header name; named
+    columns are renamed before unnamed ones.
+    """
+    names = [value if value is not None and value != '' else f"Unnamed: {i}" for i, value in enumerate(header)]
+    unnamed = [i for i, value in enumerate(header) if value is None or value == '']
+    counts = defaultdict(int)
+    for i in [i for i in range(len(names)) if i not in unnamed] + unnamed:
+        name = original = names[i]
+        count = counts[name]
+        while count > 0:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            count = count + 1 if name in names else counts[name]
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+def _rows_to_frame(rows: List[tuple], columns: List[str], positions: List[int], start: int) -> pd.DataFrame:
+    records = [tuple(row[i] if i < len(row) else None for i in positions) for row in rows]
+    return pd.DataFrame.from_records(records, columns=columns, index=pd.RangeIndex(start, start + len(records)))
+
+def _column_filter(columns: Optional[List[str]]) -> Optional[Callable[[Any], bool]]:
+    """usecols callable that keeps the requested columns and ignores names absent from the file"""
+    if columns is None:
+        return None
+    wanted = set(columns)
+    return lambda column: column in wanted
+
+def read_input(file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load an Excel, Parquet, Feather or CSV file, reading only the requested columns
+
+    Args:
+        file_path (str): Path to input file
+        columns (list, optional): Columns to load; all columns when omitted
+    Returns:
+        DataFrame: Loaded data
+    """
+    file_type = input_format(file_path)
+    if file_type == 'excel':
+        return pd.read_excel(file_path, engine='openpyxl', sheet_name=0, usecols=_column_filter(columns))
+    if file_type == 'parquet':
+        return pd.read_parquet(file_path, columns=columns)
+    if file_type == 'feather':
+        return pd.read_feather(file_path, columns=columns)
+    return pd.read_csv(file_path, usecols=_column_filter(columns))
+
+def read_input_chunks(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Stream an Excel, Parquet, Feather or CSV file in row chunks, reading only the requested columns
+
+    Args:
+        file_path (str): Path to input file
+        chunk_size (int): Maximum number of rows per chunk
+        columns (list, optional): Columns to load; all columns when omitted
+    Returns:
+        Iterator[DataFrame]: Row chunks with an index that continues across chunks
+    """
+    file_type = input_format(file_path)
+    if file_type == 'excel':
+        yield from read_excel_chunks(file_path, chunk_size, columns=columns)
+    elif file_type == 'csv':
+        yield from pd.read_csv(file_path, usecols=_column_filter(columns), chunksize=chunk_size)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if file_type == 'parquet':
+            batches = pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns)
+        else:
+            reader = pa.ipc.open_file(pa.memory_map(file_path))
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        start = 0
+        for batch in batches:
+            if columns is not None and file_type == 'feather':
+                # Requested order, as pd.read_feather and the Parquet reader return them
+                batch = batch.select([name for name in columns if name in batch.schema.names])
+            # Feather record batches can be larger than chunk_size
+            for offset in range(0, batch.num_rows, chunk_size):
+                chunk = batch.slice(offset, chunk_size).to_pandas()
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+
+def write_excel_chunks(chunks: Iterable[pd.DataFrame], output_file: str, sheet_name: str = 'Sheet1') -> None:
+    """
+    Write DataFrame chunks one after another into a single Excel sheet
+
+    Uses openpyxl's write-only workbook, so rows are serialized as they are
+    appended and memory stays constant no matter how many chunks are written.
+    The header is taken from the first chunk.
+
+    Args:
+        chunks (Iterable[DataFrame]): Mapped chunks sharing the same columns
+        output_file (str): Path to save the workbook
+        sheet_name (str): Name of the output sheet
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    header_written = False
+    for chunk in chunks:
+        if not header_written:
+            worksheet.append([str(column) for column in chunk.columns])
+            header_written = True
+        # Python scalars with None for missing cells, as to_excel writes them
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            worksheet.append(row)
+    workbook.save(output_file)
+
+def write_output(output_data: pd.DataFrame, output_file: str, compression: Optional[str] = None) -> None:
+    """
+    Save mapped data in the format selected by the output file extension
+
+    Parquet and Feather keep column dtypes; they need pyarrow installed.
+
+    Args:
+        output_data (DataFrame): Mapped data
+        output_file (str): Path to save mapped data (.xlsx, .parquet, .feather/.arrow, .csv[.gz])
+        compression (str, optional): Codec for Parquet/Feather ('snappy', 'zstd', 'lz4', ...) or CSV ('gzip', ...)
+    """
+    file_type = output_format(output_file)
+    if file_type == 'excel':
+        output_data.to_excel(output_file, index=False, engine='openpyxl')
+    elif file_type == 'parquet':
+        output_data.to_parquet(output_file, index=False, compression=compression or 'snappy')
+    elif file_type == 'feather':
+        if compression is None:
+            output_data.to_feather(output_file)
+        else:
+            output_data.to_feather(output_file, compression=compression)
+    else:
+        output_data.to_csv(output_file, index=False, compression=compression or 'infer')
+
+def write_output_chunks(chunks: Iterable[pd.DataFrame], output_file: str, compression: Optional[str] = None) -> None:
+    """
+    Stream mapped chunks into the format selected by the output file extension
+
+    Parquet keeps categorical columns dictionary encoded; streamed Feather
+    files store them as plain values. Writing starts with the first chunk; a
+    column that is still entirely missing keeps that chunk's dtype until a
+    later chunk brings its first values, and a later chunk may not fit the
+    type so far (e.g. floats after integers). In both cases the rows written
+    so far are rewritten with the new schema, so only one chunk is held at a time.
+
+    Args:
+        chunks (Iterable[DataFrame]): Mapped chunks sharing the same columns
+        output_file (str): Path to save mapped data (.xlsx, .parquet, .feather/.arrow, .csv[.gz])
+        compression (str, optional): Codec, as for write_output()
+    """
+    file_type = output_format(output_file)
+    if file_type == 'excel':
+        write_excel_chunks(chunks, output_file)
+    elif file_type == 'csv':
+        _write_csv_chunks(chunks, output_file, compression)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        schema = None
+        sample = None
+        try:
+            for chunk in chunks:
+                sample, filled = update_type_sample(chunk, sample)
+                if writer is None:
+                    schema = _stream_schema(arrow_schema([sample]), file_type)
+                    writer = _open_arrow_writer(output_file, file_type, schema, compression)
+                elif filled:
+                    typed = _stream_schema(fill_schema(schema, sample, filled), file_type)
+                    if not typed.equals(schema):
+                        writer.close()
+                        writer = None
+                        schema = typed
+                        writer = _rewrite_arrow_output(output_file, file_type, schema, compression)
+                try:
+                    table = arrow_table(chunk, schema)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    writer.close()
+                    writer = None
+                    schema = _stream_schema(_widen_schema(schema, arrow_schema([chunk])), file_type)
+                    writer = _rewrite_arrow_output(output_file, file_type, schema, compression)
+                    table = arrow_table(chunk, schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+def _stream_schema(schema: Any, file_type: str) -> Any:
+    import pyarrow as pa
+    if file_type != 'feather':
+        return schema
+    # IPC files allow one dictionary per column, but each chunk's categoricals carry their own categories
+    return pa.schema([field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                      for field in schema], metadata=schema.metadata)
+
+def _widen_schema(schema: Any, chunk_schema: Any) -> Any:
+    """Promote the fields of schema whose values do not fit the chunk's types (e.g. int64 -> double)"""
+    import pyarrow as pa
+    fields = []
+    for field in schema:
+        chunk_type = chunk_schema.field(field.name).type
+        value_type = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+        if pa.types.is_dictionary(chunk_type):
+            chunk_type = chunk_type.value_type
+        if chunk_type != value_type and not pa.types.is_null(chunk_type):
+            # Categorical and plain chunks of the same values share a field; other changes are promoted
+            field = pa.unify_schemas([pa.schema([field.with_type(value_type)]), pa.schema([field.with_type(chunk_type)])],
+                                     promote_options='permissive').field(0)
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+def _open_arrow_writer(output_file: str, file_type: str, schema: Any, compression: Optional[str]) -> Any:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if file_type == 'parquet':
+        return pq.ParquetWriter(output_file, schema, compression=compression or 'snappy')
+    return pa.ipc.new_file(output_file, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+def _rewrite_arrow_output(output_file: str, file_type: str, schema: Any, compression: Optional[str]) -> Any:
+    """Copy the batches written so far into a writer with a new schema, returning that writer"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    written_file = output_file + '.partial'
+    os.replace(output_file, written_file)
+    writer = _open_arrow_writer(output_file, file_type, schema, compression)
+    try:
+        if file_type == 'parquet':
+            batches = pq.ParquetFile(written_file).iter_batches()
+        else:
+            reader = pa.ipc.open_file(pa.memory_map(written_file))
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+    except Exception:
+        writer.close()
+        raise
+    finally:
+        os.remove(written_file)
+    return writer
+
+def _write_csv_chunks(chunks: Iterable[pd.DataFrame], output_file: str, compression: Optional[str]) -> None:
+    suffix = os.path.splitext(output_file)[1].lower()
+    codec = compression or {'.zip': 'zip', '.tar': 'tar'}.get(suffix)
+    if codec == 'tar':
+        raise ValueError(f"tar archives cannot be streamed; use another compression for {output_file}")
+    if codec == 'zip':
+        # One archive member for all chunks; appending would add a member per chunk
+        member = os.path.basename(output_file)[:-len(suffix)] if suffix == '.zip' else os.path.basename(output_file)
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(member, 'w') as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='') as handle:
+                for i, chunk in enumerate(chunks):
+                    chunk.to_csv(handle, index=False, header=i == 0)
+        return
+    # gzip, bz2, xz and zstd streams may be concatenated, so appending chunk by chunk is valid
+    first = True
+    for chunk in chunks:
+        chunk.to_csv(output_file, index=False, header=first, mode='w' if first else 'a',
+                     compression=compression or 'infer')
+        first = False
+
+def update_type_sample(chunk: pd.DataFrame, sample: Optional[pd.DataFrame] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Track the first non-missing value of every column across a stream of chunks
+
+    Args:
+        chunk (DataFrame): Next chunk
+        sample (DataFrame, optional): Result of the previous call; None for the first chunk
+    Returns:
+        Tuple[DataFrame, list]: One-row frame usable with arrow_schema (columns without
+            values so far keep the first chunk's dtype), and the columns this chunk gave
+            their first values
+    """
+    columns = {}
+    filled = []
+    for column in chunk.columns:
+        if sample is not None and sample[column].notna().any():
+            columns[column] = sample[column]
+            continue
+        present = chunk[column][chunk[column].notna()]
+        if len(present):
+            filled.append(column)
+            columns[column] = present.iloc[:1].reset_index(drop=True)
+        else:
+            columns[column] = chunk[column].iloc[:1].reset_index(drop=True) if sample is None else sample[column]
+    return pd.DataFrame(columns), filled
+
+def fill_schema(schema: Any, sample: pd.DataFrame, filled: List[str]) -> Any:
+    """schema with the filled columns retyped from the sample of update_type_sample"""
+    import pyarrow as pa
+    typed = arrow_schema([sample])
+    return pa.schema([typed.field(field.name) if field.name in filled else field for field in schema],
+                     metadata=typed.metadata)
+
+def arrow_schema(chunks: List[pd.DataFrame]) -> Any:
+    """Arrow schema taking each column's dtype from the first chunk where it has values"""
+    import pyarrow as pa
+    # One value per column is enough to infer its type (object columns need a non-missing one)
+    columns = {}
+    for column in chunks[0].columns:
+        values = next((part[column][part[column].notna()] for part in chunks if part[column].notna().any()),
+                      chunks[0][column])
+        columns[column] = values.iloc[:1].reset_index(drop=True)
+    return pa.Schema.from_pandas(pd.DataFrame(columns), preserve_index=False)
+
+def arrow_table(chunk: pd.DataFrame, schema: Any) -> Any:
+    """Convert a chunk to an Arrow table with the given schema"""
+    import pyarrow as pa
+    # All-missing columns carry no type of their own (e.g. float64 NaN); send them as nulls
+    empty = [column for column in chunk.columns if chunk[column].isna().all()]
+    if empty:
+        chunk = chunk.copy()
+        for column in empty:
+            chunk[column] = pd.Series([None] * len(chunk), index=chunk.index, dtype=object)
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+def _direct(series: pd.Series) -> pd.Series:
+    return series
+
+def _uppercase(series: pd.Series) -> pd.Series:
+    return series.str.upper()
+
+def _lowercase(series: pd.Series) -> pd.Series:
+    return series.str.lower()
+
+def _first_three_chars(series: pd.Series) -> pd.Series:
+    return series.str[:3]
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """Make a column usable with the .str accessor (all-empty Excel columns load as float64)"""
+    if pd.api.types.is_string_dtype(series.dtype):
+        return series
+    return series.astype(object)
+
+def _split_part(series: pd.Series, separator: str, position: int, missing: Any = '') -> pd.Series:
+    """
+    Vectorized str.split(separator)[position]
+
+    Values without enough parts get `missing`; missing input values are kept as they are.
+    """
+    # .str.split builds a Python list per row; Arrow splits text columns without them
+    array = _arrow_strings(series) if USE_ARROW_KERNELS and pd.api.types.is_string_dtype(series.dtype) else None
+    if array is not None:
+        parts = _from_arrow_strings(_arrow_split_part(array, separator, position), series)
+    else:
+        parts = _as_text(series).str.split(separator, regex=False)
+        # Splitting an all-missing string column gives float64 NaN, which has no .str accessor
+        if parts.dtype == object:
+            parts = parts.str[position]
+    return _keep_text_dtype(parts.fillna(missing).where(series.notna(), series), series)
+
+def _keep_text_dtype(result: pd.Series, series: pd.Series) -> pd.Series:
+    """Give split results (object, via lists) the string dtype of their source, like other .str methods"""
+    if series.dtype != object and pd.api.types.is_string_dtype(series.dtype):
+        return result.astype(series.dtype)
+    return result
+
+def _bin_values(series: pd.Series, edges: List[float], labels: List[str]) -> pd.Series:
+    """
+    Vectorized binning: value < edges[0] -> labels[0], ..., value >= edges[-1] -> labels[-1]
+
+    Missing or non-numeric values stay missing instead of falling into a bin.
+    """
+    values = pd.to_numeric(series, errors='coerce')
+    conditions = [values < edge for edge in edges] + [values >= edges[-1]]
+    return pd.Series(np.select(conditions, labels, default=None), index=series.index, name=series.name)
+
+def _extract_domain(series: pd.Series) -> pd.Series:
+    return _split_part(series, '@', 1)
+
+def _age_category(series: pd.Series) -> pd.Series:
+    return _bin_values(series, [30, 45], list(AGE_CATEGORIES.categories))
+
+def _before_at(series: pd.Series) -> pd.Series:
+    return _split_part(series, '@', 0)
+
+def _first_letter(series: pd.Series) -> pd.Series:
+    return series.str[0]
+
+def _row_extract_domain(email: str) -> str:
+    return email.split('@')[1] if '@' in email else ''
+
+def _row_before_at(email: str) -> str:
+    return email.split('@')[0]
+
+def _row_age_category(age: float) -> str:
+    if age < 30:
+        return 'Young'
+    elif age < 45:
+        return 'Middle'
+    else:
+        return 'Senior'
+
+# Arrow string kernels. They run on text columns (object or pandas string
+# dtype), which pandas processes one Python string at a time for object
+# columns and, for some methods (split, indexing), for string columns too.
+# Results keep the source column's dtype. A kernel returns None to decline,
+# e.g. non-ASCII text whose case mapping differs between Arrow and Python.
+USE_ARROW_KERNELS = True
+
+def _arrow_strings(series: pd.Series) -> Optional[Any]:
+    """Text column as a pyarrow string array, or None if pyarrow is missing or values are not all text"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    try:
+        if series.dtype != object:
+            # pandas string columns are usually Arrow-backed already, in several chunks after a concat
+            array = pa.array(series.array)
+            return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+        return pa.array(series, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+def _from_arrow_strings(result: Any, series: pd.Series) -> pd.Series:
+    """
+    Back to a column of the input's dtype. Object columns get pandas' missing
+    values: the input's where it was missing, NaN for empty results.
+    """
+    if series.dtype != object:
+        return pd.Series(pd.array(result, dtype=series.dtype), index=series.index, name=series.name)
+    values = result.to_numpy(zero_copy_only=False)
+    if result.null_count:
+        values = values.astype(object, copy=True)
+        missing = series.isna().to_numpy()
+        values[result.is_null().to_numpy(zero_copy_only=False) & ~missing] = np.nan
+        values[missing] = series.to_numpy()[missing]
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+def _arrow_ascii_only(array: Any) -> bool:
+    import pyarrow.compute as pc
+    return bool(pc.all(pc.string_is_ascii(array)).as_py())
+
+def _arrow_uppercase(array: Any) -> Optional[Any]:
+    import pyarrow.compute as pc
+    return pc.ascii_upper(array) if _arrow_ascii_only(array) else None
+
+def _arrow_lowercase(array: Any) -> Optional[Any]:
+    import pyarrow.compute as pc
+    return pc.ascii_lower(array) if _arrow_ascii_only(array) else None
+
+def _arrow_first_three_chars(array: Any) -> Any:
+    import pyarrow.compute as pc
+    return pc.utf8_slice_codeunits(array, 0, 3)
+
+def _arrow_split_part(array: Any, separator: str, position: int) -> Any:
+    """str.split(separator)[position] of each value, null where there are not enough parts"""
+    import pyarrow.compute as pc
+    parts = pc.split_pattern(array, separator)
+    lengths = pc.list_value_length(parts)
+    if position >= 0:
+        present = pc.greater(lengths, position)
+        index = pc.add(parts.offsets[:-1], position)
+    else:
+        present = pc.greater_equal(lengths, -position)
+        index = pc.add(parts.offsets[1:], position)
+    # list_element needs a part at the same position in every row
+    return pc.take(parts.values, pc.if_else(present, index, None))
+
+def _arrow_extract_domain(array: Any) -> Any:
+    import pyarrow.compute as pc
+    # Values without '@' give '' like _extract_domain
+    return pc.if_else(pc.is_valid(array), pc.coalesce(_arrow_split_part(array, '@', 1), ''), None)
+
+def _arrow_before_at(array: Any) -> Any:
+    import pyarrow.compute as pc
+    return pc.list_element(pc.split_pattern(array, '@'), 0)
+
+def _arrow_first_letter(array: Any) -> Any:
+    import pyarrow.compute as pc
+    # str[0] of an empty string is missing in pandas
+    return pc.if_else(pc.equal(pc.utf8_length(array), 0), None, pc.utf8_slice_codeunits(array, 0, 1))
+
+# Polars kernels: pl.Expr -> pl.Expr equivalents of the pandas transforms, used
+# by the Polars backend (see MappingPlan.to_polars)
+
+def _polars_direct(expr: Any) -> Any:
+    return expr
+
+def _polars_case_batch(series: Any, name: str) -> Any:
+    # Case mapping of non-ASCII text differs between Polars, Python and Arrow
+    # (e.g. the German sharp s), so such batches take the pandas transform
+    import polars as pl
+    if series.str.contains(r'[^\x00-\x7F]').any():
+        return pl.from_pandas(TRANSFORMS[name](series.to_pandas()))
+    return series.str.to_uppercase() if name == 'uppercase' else series.str.to_lowercase()
+
+def _polars_uppercase(expr: Any) -> Any:
+    import polars as pl
+    return expr.map_batches(functools.partial(_polars_case_batch, name='uppercase'),
+                            return_dtype=pl.String, is_elementwise=True)
+
+def _polars_lowercase(expr: Any) -> Any:
+    import polars as pl
+    return expr.map_batches(functools.partial(_polars_case_batch, name='lowercase'),
+                            return_dtype=pl.String, is_elementwise=True)
+
+def _polars_substring(expr: Any, start: int, length: int) -> Any:
+    return expr.str.slice(start, length)
+
+def _polars_split_part(expr: Any, separator: str, position: int, missing: Any = '') -> Any:
+    import polars as pl
+    parts = expr.str.split(separator).list.get(position, null_on_oob=True)
+    return pl.when(expr.is_not_null()).then(parts.fill_null(missing))
+
+def _polars_bin(expr: Any, edges: List[float], labels: List[str]) -> Any:
+    import polars as pl
+    values = expr.cast(pl.Float64, strict=False)
+    chain = pl.when(values < edges[0]).then(pl.lit(labels[0]))
+    for edge, label in zip(edges[1:], labels[1:]):
+        chain = chain.when(values < edge).then(pl.lit(label))
+    return chain.when(values >= edges[-1]).then(pl.lit(labels[-1]))
+
+def _polars_extract_domain(expr: Any) -> Any:
+    return _polars_split_part(expr, '@', 1)
+
+def _polars_age_category(expr: Any) -> Any:
+    return _polars_bin(expr, [30, 45], list(AGE_CATEGORIES.categories))
+
+def _polars_before_at(expr: Any) -> Any:
+    return expr.str.split('@').list.first()
+
+def _polars_first_letter(expr: Any) -> Any:
+    import polars as pl
+    return pl.when(expr.str.len_chars() > 0).then(expr.str.slice(0, 1))
+
+# Spark kernels: Column -> Column equivalents of the pandas transforms, built only
+# from pyspark.sql.functions so a mapping runs in the JVM without Python UDFs (see
+# excel_to_pyspark_df.map_spark_df). Spark's upper/lower use full Unicode case
+# mapping like Python's str.upper ("ß" -> "SS"); pandas gives the same for object
+# columns but not for Arrow-backed strings.
+
+def _spark_direct(column: Any) -> Any:
+    return column
+
+def _spark_uppercase(column: Any) -> Any:
+    from pyspark.sql import functions as F
+    return F.upper(column)
+
+def _spark_lowercase(column: Any) -> Any:
+    from pyspark.sql import functions as F
+    return F.lower(column)
+
+def _spark_substring(column: Any, start: int, length: int) -> Any:
+    from pyspark.sql import functions as F
+    return F.substring(column, start + 1, length)
+
+def _spark_split_part(column: Any, separator: str, position: int, missing: Any = '') -> Any:
+    from pyspark.sql import functions as F
+    parts = F.split(column.cast('string'), re.escape(separator), -1)
+    if position >= 0:
+        part = F.get(parts, position)
+    else:
+        part = F.when(F.size(parts) >= -position, F.element_at(parts, position))
+    return F.when(column.isNotNull(), F.coalesce(part, F.lit(missing)))
+
+def _spark_bin(column: Any, edges: List[float], labels: List[str]) -> Any:
+    from pyspark.sql import functions as F
+    values = column.cast('double')
+    result = F.when(values < edges[0], F.lit(labels[0]))
+    for edge, label in zip(edges[1:], labels[1:]):
+        result = result.when(values < edge, F.lit(label))
+    return result.when(values >= edges[-1], F.lit(labels[-1]))
+
+def _spark_extract_domain(column: Any) -> Any:
+    return _spark_split_part(column, '@', 1)
+
+def _spark_age_category(column: Any) -> Any:
+    return _spark_bin(column, [30, 45], list(AGE_CATEGORIES.categories))
+
+def _spark_before_at(column: Any) -> Any:
+    from pyspark.sql import functions as F
+    return F.get(F.split(column, '@', -1), 0)
+
+def _spark_first_letter(column: Any) -> Any:
+    from pyspark.sql import functions as F
+    return F.when(F.length(column) > 0, F.substring(column, 1, 1))
+
+# Input kinds a transform may declare
+TRANSFORM_INPUTS = ('any', 'text', 'numeric')
+
+@dataclass(frozen=True)
+class Transform:
+    """
+    A named mapping rule
+
+    vectorized runs on the whole source column. If it rejects the column,
+    a 'text' transform is retried on the values' str() (so uppercase or
+    first_letter work on an integer column); otherwise row_fallback, when
+    given, maps single non-missing values. arrow_kernel, when given, maps a pyarrow string array and is
+    tried first on object or string columns holding only text; its results
+    match the pandas ones exactly, in the source column's dtype. polars_kernel is the equivalent
+    pl.Expr -> pl.Expr for the Polars backend, spark_kernel the Spark Column -> Column one. input_dtype is one of TRANSFORM_INPUTS; output_dtype is the
+    dtype planned for the result, see OUTPUT_DTYPES.
+    """
+    name: str
+    vectorized: Callable[[pd.Series], pd.Series]
+    input_dtype: str = 'any'
+    output_dtype: Union[str, pd.CategoricalDtype] = 'object'
+    row_fallback: Optional[Callable[[Any], Any]] = None
+    arrow_kernel: Optional[Callable[[Any], Any]] = None
+    polars_kernel: Optional[Callable[[Any], Any]] = None
+    spark_kernel: Optional[Callable[[Any], Any]] = None
+
+    def __call__(self, series: pd.Series) -> pd.Series:
+        if self.arrow_kernel is not None and USE_ARROW_KERNELS and pd.api.types.is_string_dtype(series.dtype):
+            array = _arrow_strings(series)
+            result = None if array is None else self.arrow_kernel(array)
+            if result is not None:
+                return _from_arrow_strings(result, series)
+        try:
+            return self.vectorized(series)
+        except (AttributeError, TypeError, ValueError):
+            if self.input_dtype == 'text':
+                return self.vectorized(_to_text(series))
+            if self.row_fallback is None:
+                raise
+            return series.map(self.row_fallback, na_action='ignore')
+
+# Planned output dtypes: 'object' keeps whatever the transform returns, 'same'
+# keeps the source column's dtype, 'category' converts low-cardinality results
+# to categoricals; a CategoricalDtype fixes the categories up front (binning rules)
+OUTPUT_DTYPES = ('object', 'same', 'category')
+
+# Open categoricals are only used when they save memory: at most this many
+# distinct values per row
+CATEGORY_MAX_RATIO = 0.5
+
+AGE_CATEGORIES = pd.CategoricalDtype(['Young', 'Middle', 'Senior'], ordered=True)
+
+# Transform rule name -> Transform, in registration order (simplest rules first)
+TRANSFORMS: Dict[str, Transform] = {}
+
+def register_transform(name: str, vectorized: Callable[[pd.Series], pd.Series], input_dtype: str = 'any',
+                       output_dtype: Union[str, pd.CategoricalDtype] = 'object', row_fallback: Optional[Callable[[Any], Any]] = None,
+                       arrow_kernel: Optional[Callable[[Any], Any]] = None,
+                       polars_kernel: Optional[Callable[[Any], Any]] = None,
+                       spark_kernel: Optional[Callable[[Any], Any]] = None) -> Transform:
+    """
+    Register a named transform usable in the transform_rule column of mapping sheets
+
+    Functions must be defined at module level so compiled plans can be sent to worker processes.
+
+    Args:
+        name (str): Rule name
+        vectorized (callable): Series -> Series implementation
+        input_dtype (str): 'any', 'text' or 'numeric'
+        output_dtype (str or CategoricalDtype): One of OUTPUT_DTYPES, or the fixed categories of the result
+        row_fallback (callable, optional): value -> value implementation for columns the vectorized one rejects
+        arrow_kernel (callable, optional): pyarrow string array -> array implementation (None to decline)
+        polars_kernel (callable, optional): pl.Expr -> pl.Expr implementation for the Polars backend
+        spark_kernel (callable, optional): Spark Column -> Column implementation for map_spark_df
+    Returns:
+        Transform: The registered transform
+    """
+    if input_dtype not in TRANSFORM_INPUTS:
+        raise ValueError(f"Unknown input dtype for transform {name}: {input_dtype}, expected one of {TRANSFORM_INPUTS}")
+    if not isinstance(output_dtype, pd.CategoricalDtype) and output_dtype not in OUTPUT_DTYPES:
+        raise ValueError(f"Unknown output dtype for transform {name}: {output_dtype}, expected one of {OUTPUT_DTYPES}")
+    transform = Transform(name, vectorized, input_dtype, output_dtype, row_fallback, arrow_kernel, polars_kernel,
+                          spark_kernel)
+    TRANSFORMS[name] = transform
+    return transform
+
+register_transform('direct', _direct, output_dtype='same', polars_kernel=_polars_direct, spark_kernel=_spark_direct)
+register_transform('uppercase', _uppercase, 'text', row_fallback=str.upper, arrow_kernel=_arrow_uppercase,
+                   polars_kernel=_polars_uppercase, spark_kernel=_spark_uppercase)
+register_transform('lowercase', _lowercase, 'text', row_fallback=str.lower, arrow_kernel=_arrow_lowercase,
+                   polars_kernel=_polars_lowercase, spark_kernel=_spark_lowercase)
+register_transform('first_three_chars', _first_three_chars, 'text', row_fallback=operator.itemgetter(slice(0, 3)),
+                   arrow_kernel=_arrow_first_three_chars,
+                   polars_kernel=functools.partial(_polars_substring, start=0, length=3),
+                   spark_kernel=functools.partial(_spark_substring, start=0, length=3))
+register_transform('extract_domain', _extract_domain, 'text', 'category', row_fallback=_row_extract_domain,
+                   arrow_kernel=_arrow_extract_domain, polars_kernel=_polars_extract_domain,
+                   spark_kernel=_spark_extract_domain)
+register_transform('age_category', _age_category, 'numeric', AGE_CATEGORIES, row_fallback=_row_age_category,
+                   polars_kernel=_polars_age_category, spark_kernel=_spark_age_category)
+register_transform('before_at', _before_at, 'text', row_fallback=_row_before_at, arrow_kernel=_arrow_before_at,
+                   polars_kernel=_polars_before_at, spark_kernel=_spark_before_at)
+register_transform('first_letter', _first_letter, 'text', 'category', row_fallback=operator.itemgetter(0),
+                   arrow_kernel=_arrow_first_letter, polars_kernel=_polars_first_letter,
+                   spark_kernel=_spark_first_letter)
+
+def _substring(series: pd.Series, start: int, length: int) -> pd.Series:
+    return _as_text(series).str[start:start + length]
+
+@dataclass(frozen=True)
+class TransformFactory:
+    """
+    A parameterized mapping rule such as substr(0,3)
+
+    build is called once, at plan compile time, with the parsed argument
+    groups (separated by ';', values by ',') and returns the Transform to
+    run. When field_group is set, an extra leading group may name the
+    source field, as in bin(age; 30,45; Young,Middle,Senior).
+    """
+    name: str
+    build: Callable[..., Transform]
+    groups: int = 1
+    field_group: bool = False
+
+# Parameterized rule name -> TransformFactory
+TRANSFORM_FACTORIES: Dict[str, TransformFactory] = {}
+
+def register_transform_factory(name: str, build: Callable[..., Transform], groups: int = 1,
+                               field_group: bool = False) -> TransformFactory:
+    """Register a parameterized rule usable as name(arguments) in mapping sheets"""
+    factory = TransformFactory(name, build, groups, field_group)
+    TRANSFORM_FACTORIES[name] = factory
+    return factory
+
+_RULE_CALL = re.compile(r'^\s*(\w+)\s*\((.*)\)\s*$', re.DOTALL)
+_RULE_TOKEN = re.compile(r"""'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)"|([^,;'"]+)|([,;])""")
+
+def _parse_value(token: str) -> Any:
+    token = token.strip()
+    for convert in (int, float):
+        try:
+            return convert(token)
+        except ValueError:
+            continue
+    return token
+
+def parse_rule_arguments(text: str) -> List[List[Any]]:
+    """
+    Split rule arguments into groups
+
+    Groups are separated by ';' and values by ','. Quoted values are kept
+    as strings; bare values become int or float when they parse as numbers.
+    """
+    groups, values, current = [], [], None
+    for quoted_single, quoted_double, bare, separator in (m.groups() for m in _RULE_TOKEN.finditer(text)):
+        if separator:
+            values.append(current)
+            current = None
+            if separator == ';':
+                groups.append(values)
+                values = []
+        elif bare is not None:
+            if bare.strip():
+                current = _parse_value(bare)
+        else:
+            value = quoted_single if quoted_single is not None else quoted_double
+            current = re.sub(r'\\(.)', r'\1', value)
+    values.append(current)
+    groups.append(values)
+    if groups == [[None]]:
+        return []
+    if any(value is None for group in groups for value in group):
+        raise ValueError(f"Empty argument in rule arguments: ({text})")
+    return groups
+
+def is_named_rule(transform_rule: Any) -> bool:
+    """True for registered rule names and name(arguments) calls of a registered TransformFactory"""
+    if transform_rule in TRANSFORMS:
+        return True
+    call = _RULE_CALL.match(transform_rule) if isinstance(transform_rule, str) else None
+    return call is not None and call.group(1) in TRANSFORM_FACTORIES
+
+def parse_rule_call(transform_rule: str) -> Tuple[TransformFactory, List[List[Any]], Optional[str]]:
+    """
+    Split a parameterized rule like bin(age; 30,45; Young,Middle,Senior) into its parts
+
+    Args:
+        transform_rule (str): name(arguments) call of a registered TransformFactory
+    Returns:
+        Tuple: The factory, its argument groups and the source field named inside the rule, if any
+    """
+    call = _RULE_CALL.match(transform_rule) if isinstance(transform_rule, str) else None
+    if call is None or call.group(1) not in TRANSFORM_FACTORIES:
+        raise ValueError(f"Unknown transform rule '{transform_rule}'; known rules: {sorted(TRANSFORMS)}, "
+                         f"parameterized rules: {sorted(name + '(...)' for name in TRANSFORM_FACTORIES)}")
+    factory = TRANSFORM_FACTORIES[call.group(1)]
+    groups = parse_rule_arguments(call.group(2))
+    field = None
+    if factory.field_group and len(groups) == factory.groups + 1:
+        if len(groups[0]) != 1:
+            raise ValueError(f"Expected a single source field as the first argument of {transform_rule}")
+        field, groups = str(groups[0][0]), groups[1:]
+    if len(groups) != factory.groups:
+        raise ValueError(f"{factory.name} expects {factory.groups} argument group(s), got {len(groups)}: {transform_rule}")
+    return factory, groups, field
+
+def resolve_transform(transform_rule: str) -> Tuple[Transform, Optional[str]]:
+    """
+    Resolve a transform_rule cell to a Transform
+
+    Args:
+        transform_rule (str): Registered rule name or parameterized rule like split('@',0)
+    Returns:
+        Tuple: The transform and the source field named inside the rule, if any
+    """
+    if transform_rule in TRANSFORMS:
+        return TRANSFORMS[transform_rule], None
+    factory, groups, field = parse_rule_call(transform_rule)
+    try:
+        transform = factory.build(*groups)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid arguments in transform rule {transform_rule}: {e}") from e
+    return transform, field
+
+def _build_substr(arguments: List[Any]) -> Transform:
+    start, length = arguments
+    if not isinstance(start, int) or not isinstance(length, int) or start < 0 or length < 0:
+        raise ValueError("substr(start, length) takes two non-negative integers")
+    return Transform(f"substr({start},{length})", functools.partial(_substring, start=start, length=length), 'text',
+                     polars_kernel=functools.partial(_polars_substring, start=start, length=length),
+                     spark_kernel=functools.partial(_spark_substring, start=start, length=length))
+
+def _build_split(arguments: List[Any]) -> Transform:
+    separator, position = arguments
+    if not isinstance(position, int):
+        raise ValueError("split(separator, position) takes an integer position")
+    return Transform(f"split({separator!r},{position})",
+                     functools.partial(_split_part, separator=str(separator), position=position), 'text',
+                     polars_kernel=functools.partial(_polars_split_part, separator=str(separator), position=position),
+                     spark_kernel=functools.partial(_spark_split_part, separator=str(separator), position=position))
+
+def _build_bin(edges: List[Any], labels: List[Any]) -> Transform:
+    if not all(isinstance(edge, (int, float)) for edge in edges) or list(edges) != sorted(edges):
+        raise ValueError("bin edges must be increasing numbers")
+    if len(labels) != len(edges) + 1:
+        raise ValueError(f"bin needs {len(edges) + 1} labels for {len(edges)} edges")
+    labels = [str(label) for label in labels]
+    return Transform(f"bin({','.join(map(str, edges))}; {','.join(labels)})",
+                     functools.partial(_bin_values, edges=list(edges), labels=labels), 'numeric',
+                     pd.CategoricalDtype(labels, ordered=True),
+                     polars_kernel=functools.partial(_polars_bin, edges=list(edges), labels=labels),
+                     spark_kernel=functools.partial(_spark_bin, edges=list(edges), labels=labels))
+
+register_transform_factory('substr', _build_substr)
+register_transform_factory('split', _build_split)
+register_transform_factory('bin', _build_bin, groups=2, field_group=True)
+
+# --- Expression rules -------------------------------------------------------
+# A transform_rule that is neither a registered nor a parameterized rule is
+# parsed as an expression over source columns, e.g.
+#   upper(first_name) || ' ' || last_name
+#   if(age < 30, 'Young', 'Other')
+# Expressions are parsed once into a small AST when the plan is compiled and
+# evaluated a whole column at a time.
+
+@dataclass(frozen=True)
+class Column:
+    """Reference to a source column; quote names with spaces in backticks"""
+    name: str
+
+@dataclass(frozen=True)
+class Literal:
+    value: Any
+
+@dataclass(frozen=True)
+class Call:
+    """Call of an expression function or of a registered transform"""
+    function: str
+    arguments: Tuple[Any, ...]
+
+@dataclass(frozen=True)
+class BinaryOp:
+    operator: str
+    left: Any
+    right: Any
+
+@dataclass(frozen=True)
+class UnaryOp:
+    operator: str
+    operand: Any
+
+Expression = Union[Column, Literal, Call, BinaryOp, UnaryOp]
+
+def _to_text(value: Any) -> Any:
+    """Stringify a column for concatenation, leaving missing values missing"""
+    if not isinstance(value, pd.Series):
+        return value if isinstance(value, str) or pd.isna(value) else str(value)
+    if pd.api.types.is_string_dtype(value.dtype):
+        return value
+    return value.astype(str).mask(value.isna())
+
+def _to_series(value: Any, index: pd.Index) -> pd.Series:
+    if isinstance(value, pd.Series):
+        return value
+    return pd.Series([value] * len(index), index=index, dtype=object)
+
+def _trim(series: pd.Series) -> pd.Series:
+    return _as_text(series).str.strip()
+
+def _length(series: pd.Series) -> pd.Series:
+    return _as_text(series).str.len()
+
+def _concat(left: Any, right: Any) -> Any:
+    left, right = _to_text(left), _to_text(right)
+    if isinstance(left, pd.Series) and isinstance(right, pd.Series) and left.dtype != right.dtype:
+        # An all-missing column (e.g. in one CSV chunk) stays object; give it the other side's string dtype
+        text_dtype = right.dtype if left.dtype == object else left.dtype
+        left, right = left.astype(text_dtype), right.astype(text_dtype)
+    return left + right
+
+def _condition(value: Any, index: pd.Index) -> pd.Series:
+    return _to_series(value, index).fillna(False).astype(bool)
+
+def _if(condition: Any, then: Any, otherwise: Any, index: pd.Index) -> pd.Series:
+    return _to_series(then, index).where(_condition(condition, index), _to_series(otherwise, index))
+
+def _coalesce(*values: Any, index: pd.Index) -> pd.Series:
+    result = _to_series(values[0], index)
+    for value in values[1:]:
+        result = result.fillna(_to_series(value, index))
+    return result
+
+_BINARY_OPERATORS = {
+    '||': _concat,
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    '=': operator.eq, '==': operator.eq, '!=': operator.ne, '<>': operator.ne,
+}
+
+# Expression function name -> callable taking the evaluated arguments; registered
+# transform names (uppercase, extract_domain, ...) are callable on one column too
+EXPRESSION_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    'upper': TRANSFORMS['uppercase'],
+    'lower': TRANSFORMS['lowercase'],
+    'trim': _trim,
+    'length': _length,
+    'substr': _substring,
+    'split': _split_part,
+}
+
+def _expression_function(name: str) -> Optional[Callable[..., Any]]:
+    if name in EXPRESSION_FUNCTIONS:
+        return EXPRESSION_FUNCTIONS[name]
+    if name in TRANSFORMS:
+        return TRANSFORMS[name]
+    return None
+
+def evaluate_expression(node: Expression, data: pd.DataFrame) -> Any:
+    """
+    Evaluate an expression AST against a DataFrame, one column at a time
+
+    Returns:
+        Series, or a scalar when the expression does not reference any column
+    """
+    if isinstance(node, Column):
+        return data[node.name]
+    if isinstance(node, Literal):
+        return node.value
+    if isinstance(node, BinaryOp):
+        left = evaluate_expression(node.left, data)
+        right = evaluate_expression(node.right, data)
+        if node.operator == 'and':
+            return _condition(left, data.index) & _condition(right, data.index)
+        if node.operator == 'or':
+            return _condition(left, data.index) | _condition(right, data.index)
+        return _BINARY_OPERATORS[node.operator](left, right)
+    if isinstance(node, UnaryOp):
+        operand = evaluate_expression(node.operand, data)
+        if node.operator == 'not':
+            return ~_condition(operand, data.index)
+        return -operand
+    arguments = [evaluate_expression(argument, data) for argument in node.arguments]
+    if node.function == 'if':
+        return _if(*arguments, index=data.index)
+    if node.function == 'coalesce':
+        return _coalesce(*arguments, index=data.index)
+    function = _expression_function(node.function)
+    if arguments and not isinstance(arguments[0], pd.Series):
+        arguments[0] = _to_series(arguments[0], data.index)
+    return function(*arguments)
+
+def expression_fields(node: Expression) -> List[str]:
+    """Source columns referenced by an expression, in order of appearance"""
+    if isinstance(node, Column):
+        return [node.name]
+    if isinstance(node, Literal):
+        return []
+    if isinstance(node, BinaryOp):
+        children = (node.left, node.right)
+    elif isinstance(node, UnaryOp):
+        children = (node.operand,)
+    else:
+        children = node.arguments
+    return list(dict.fromkeys(field for child in children for field in expression_fields(child)))
+
+_EXPRESSION_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d*)?|\.\d+)
+      | '(?P<single>(?:[^'\\]|\\.)*)'
+      | "(?P<double>(?:[^"\\]|\\.)*)"
+      | `(?P<quoted>[^`]+)`
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<op>\|\||<=|>=|<>|!=|==|[-+*/<>=(),])
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'true', 'false', 'null'}
+_ARITY = {'if': (3, 3), 'coalesce': (1, None), 'upper': (1, 1), 'lower': (1, 1), 'trim': (1, 1),
+          'length': (1, 1), 'substr': (3, 3), 'split': (3, 3)}
+
+class _ExpressionParser:
+    """Recursive descent parser; precedence from loosest: or, and, not, comparison, ||, + -, * /"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _EXPRESSION_TOKEN.match(text, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Unexpected character at position {position} in expression: {self.text}")
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind in ('single', 'double'):
+                kind, value = 'string', re.sub(r'\\(.)', r'\1', value)
+            elif kind == 'quoted':
+                kind = 'column'
+            elif kind == 'name' and value.lower() in _KEYWORDS:
+                kind, value = 'op', value.lower()
+            self.tokens.append((kind, value))
+            position = match.end()
+        self.index = 0
+
+    def parse(self) -> Expression:
+        node = self._or()
+        if self.index < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.index][1]}' in expression: {self.text}")
+        return node
+
+    def _peek(self) -> Optional[str]:
+        if self.index < len(self.tokens) and self.tokens[self.index][0] == 'op':
+            return self.tokens[self.index][1]
+        return None
+
+    def _expect(self, value: str) -> None:
+        if self._peek() != value:
+            raise ValueError(f"Expected '{value}' in expression: {self.text}")
+        self.index += 1
+
+    def _binary(self, operators: Iterable[str], operand: Callable[[], Expression]) -> Expression:
+        node = operand()
+        while self._peek() in operators:
+            op = self._peek()
+            self.index += 1
+            node = BinaryOp(op, node, operand())
+        return node
+
+    def _or(self) -> Expression:
+        return self._binary(('or',), self._and)
+
+    def _and(self) -> Expression:
+        return self._binary(('and',), self._not)
+
+    def _not(self) -> Expression:
+        if self._peek() == 'not':
+            self.index += 1
+            return UnaryOp('not', self._not())
+        return self._comparison()
+
+    def _comparison(self) -> Expression:
+        return self._binary(('<', '<=', '>', '>=', '=', '==', '!=', '<>'), self._concat)
+
+    def _concat(self) -> Expression:
+        return self._binary(('||',), self._sum)
+
+    def _sum(self) -> Expression:
+        return self._binary(('+', '-'), self._product)
+
+    def _product(self) -> Expression:
+        return self._binary(('*', '/'), self._unary)
+
+    def _unary(self) -> Expression:
+        if self._peek() == '-':
+            self.index += 1
+            return UnaryOp('-', self._unary())
+        return self._primary()
+
+    def _primary(self) -> Expression:
+        if self.index >= len(self.tokens):
+            raise ValueError(f"Unexpected end of expression: {self.text}")
+        kind, value = self.tokens[self.index]
+        self.index += 1
+        if kind == 'number':
+            return Literal(float(value) if '.' in value else int(value))
+        if kind == 'string':
+            return Literal(value)
+        if kind == 'column':
+            return Column(value)
+        if kind == 'op' and value in ('true', 'false', 'null'):
+            return Literal({'true': True, 'false': False, 'null': None}[value])
+        if kind == 'op' and value == '(':
+            node = self._or()
+            self._expect(')')
+            return node
+        if kind == 'name':
+            if self._peek() != '(':
+                return Column(value)
+            self.index += 1
+            arguments = []
+            if self._peek() != ')':
+                arguments.append(self._or())
+                while self._peek() == ',':
+                    self.index += 1
+                    arguments.append(self._or())
+            self._expect(')')
+            return self._call(value, tuple(arguments))
+        raise ValueError(f"Unexpected '{value}' in expression: {self.text}")
+
+    def _call(self, name: str, arguments: Tuple[Expression, ...]) -> Call:
+        if name not in ('if', 'coalesce') and _expression_function(name) is None:
+            raise ValueError(f"Unknown function '{name}' in expression: {self.text}")
+        low, high = _ARITY.get(name, (1, 1))
+        if len(arguments) < low or (high is not None and len(arguments) > high):
+            raise ValueError(f"{name}() takes {low if low == high else f'at least {low}'} "
+                             f"argument(s), got {len(arguments)}: {self.text}")
+        return Call(name, arguments)
+
+def parse_expression(text: str) -> Expression:
+    """
+    Parse a transform_rule expression into an AST
+
+    Args:
+        text (str): Expression such as upper(first_name) || ' ' || last_name
+    Returns:
+        Expression: Root node, ready for evaluate_expression()
+    """
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError(f"Empty transform rule: {text!r}")
+    return _ExpressionParser(text).parse()
+
+def _branch_labels(node: Expression) -> Optional[List[str]]:
+    """String literals an if() chain can produce, or None if any branch is not a literal"""
+    if isinstance(node, Literal):
+        if node.value is None:
+            return []
+        return [node.value] if isinstance(node.value, str) else None
+    if isinstance(node, Call) and node.function == 'if':
+        then, otherwise = _branch_labels(node.arguments[1]), _branch_labels(node.arguments[2])
+        if then is None or otherwise is None:
+            return None
+        return then + otherwise
+    return None
+
+def expression_dtype(node: Expression) -> Union[str, pd.CategoricalDtype]:
+    """Planned output dtype of an expression: fixed categories for if() chains over string literals"""
+    if isinstance(node, Call) and node.function == 'if':
+        labels = _branch_labels(node)
+        if labels:
+            return pd.CategoricalDtype(list(dict.fromkeys(labels)))
+    return 'object'
+
+def cast_output(series: pd.Series, dtype: Union[str, pd.CategoricalDtype]) -> pd.Series:
+    """
+    Convert a mapped column to its planned dtype
+
+    Args:
+        series (Series): Mapped column
+        dtype (str or CategoricalDtype): One of OUTPUT_DTYPES or fixed categories
+    Returns:
+        Series: series as a categorical where planned (open categories only when
+            distinct values are at most CATEGORY_MAX_RATIO of the rows), else unchanged
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series.astype(dtype)
+    if dtype != 'category' or isinstance(series.dtype, pd.CategoricalDtype) or not _saves_memory(series):
+        return series
+    return series.astype('category')
+
+def _saves_memory(series: pd.Series) -> bool:
+    """Whether an open categorical is worth it for these values, see CATEGORY_MAX_RATIO"""
+    return not series.empty and series.nunique() <= CATEGORY_MAX_RATIO * len(series)
+
+# Execution modes accepted by MappingPlan.apply(parallel=...)
+PARALLEL_MODES = ('rules', 'rows')
+
+# Smallest row partition worth sending to a worker process
+MIN_PARTITION_ROWS = 50000
+
+@dataclass(frozen=True)
+class MappingRule:
+    """
+    A single mapping sheet row, compiled
+
+    Named and parameterized rules resolve to a Transform applied to
+    source_field; anything else is parsed into an expression over any
+    number of source columns.
+    """
+    source_field: str
+    target_field: str
+    transform_rule: str
+    transform: Optional[Transform]
+    expression: Optional[Expression] = None
+
+    @property
+    def output_dtype(self) -> Union[str, pd.CategoricalDtype]:
+        """Planned dtype of the target column, see OUTPUT_DTYPES"""
+        if self.expression is not None:
+            return expression_dtype(self.expression)
+        return self.transform.output_dtype
+
+    @property
+    def source_fields(self) -> List[str]:
+        """Input columns the rule reads"""
+        if self.expression is not None:
+            return expression_fields(self.expression)
+        return [self.source_field]
+
+    def evaluate(self, input_data: pd.DataFrame) -> pd.Series:
+        """Compute the target column for a frame of input rows"""
+        if self.expression is None:
+            return self.transform(input_data[self.source_field])
+        return _to_series(evaluate_expression(self.expression, input_data), input_data.index)
+
+@dataclass(frozen=True)
+class MappingPlan:
+    """
+    Compiled, immutable form of a mapping configuration.
+
+    Build it once with compile_mapping_plan() and apply it to any number of
+    input frames; the mapping sheet is never re-read or re-parsed. With
+    categorical set, low-cardinality targets are returned as categoricals
+    (see MappingRule.output_dtype).
+    """
+    rules: Tuple[MappingRule, ...]
+    categorical: bool = True
+
+    @property
+    def source_fields(self) -> List[str]:
+        """Distinct source columns referenced by the plan, in sheet order"""
+        return list(dict.fromkeys(field for rule in self.rules for field in rule.source_fields))
+
+    @property
+    def target_fields(self) -> List[str]:
+        """Output columns produced by the plan, in sheet order"""
+        return [rule.target_field for rule in self.rules]
+
+    @property
+    def output_dtypes(self) -> Dict[str, Union[str, pd.CategoricalDtype]]:
+        """Planned dtype per target column"""
+        return {rule.target_field: rule.output_dtype for rule in self.rules}
+
+    def validate_input(self, columns) -> None:
+        """Raise if any source column required by the plan is missing"""
+        available = set(columns)
+        missing = [field for field in self.source_fields if field not in available]
+        if missing:
+            raise KeyError(f"Input data is missing source columns: {missing}")
+
+    def apply(self, input_data: pd.DataFrame, parallel: Optional[str] = None,
+              max_workers: Optional[int] = None, executor: Optional[Executor] = None) -> pd.DataFrame:
+        """
+        Apply the compiled rules to an input DataFrame
+
+        Args:
+            input_data (DataFrame): Data containing the plan's source fields
+            parallel (str, optional): None runs rules one after another; 'rules' evaluates
+                independent rules concurrently on a thread pool; 'rows' splits the rows into
+                partitions mapped on a process pool
+            max_workers (int, optional): Pool size (and number of row partitions); defaults to the CPU count
+            executor (Executor, optional): Existing pool to reuse across calls, e.g. one per streamed file
+        Returns:
+            DataFrame: Target columns in mapping sheet order, with the planned dtypes
+        """
+        self.validate_input(input_data.columns)
+        return self._cast_outputs(self._map(input_data, parallel, max_workers, executor))
+
+    def _map(self, input_data: pd.DataFrame, parallel: Optional[str], max_workers: Optional[int],
+             executor: Optional[Executor]) -> pd.DataFrame:
+        if parallel is None:
+            return self._apply_rules(input_data)
+        if parallel not in PARALLEL_MODES:
+            raise ValueError(f"Unknown parallel mode: {parallel}, expected one of {PARALLEL_MODES}")
+
+        max_workers = max_workers or os.cpu_count() or 1
+        if parallel == 'rules':
+            if executor is None:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    return self._apply_rules(input_data, pool)
+            return self._apply_rules(input_data, executor)
+
+        # Small frames are not worth the cost of shipping partitions to other processes
+        partitions = min(max_workers, -(-len(input_data) // MIN_PARTITION_ROWS))
+        if partitions <= 1:
+            return self._apply_rules(input_data)
+        source_data = input_data[self.source_fields]
+        bounds = np.linspace(0, len(source_data), partitions + 1, dtype=int)
+        parts = [source_data.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                mapped = list(pool.map(self._apply_rules, parts))
+        else:
+            mapped = list(executor.map(self._apply_rules, parts))
+        return pd.concat(mapped)
+
+    def to_polars(self, input_data: Any) -> Any:
+        """
+        Express the plan as one Polars select over the input
+
+        Args:
+            input_data (polars LazyFrame or DataFrame): Data containing the plan's source fields
+        Returns:
+            LazyFrame: Target columns in mapping sheet order; Polars plans and multithreads the query
+        """
+        lazy_frame = input_data.lazy()
+        schema = lazy_frame.collect_schema()
+        self.validate_input(schema.names())
+        return lazy_frame.select([polars_rule_expression(rule, schema) for rule in self.rules])
+
+    def open_categories(self, output_data: pd.DataFrame) -> List[str]:
+        """Targets planned as 'category' that cast_output turns into categoricals for this mapped output"""
+        if not self.categorical:
+            return []
+        return [rule.target_field for rule in self.rules
+                if rule.output_dtype == 'category' and _saves_memory(output_data[rule.target_field])]
+
+    def cast_chunks(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        Cast mapped chunks (from _map, not apply) to the planned dtypes
+
+        Open categoricals are decided once, on the first non-empty chunk, so
+        every chunk of a run gets the same dtypes.
+        """
+        open_categories = None
+        for chunk in chunks:
+            if open_categories is None and len(chunk):
+                open_categories = self.open_categories(chunk)
+            yield self._cast_outputs(chunk, open_categories or [])
+
+    def _cast_outputs(self, output_data: pd.DataFrame, open_categories: Optional[List[str]] = None) -> pd.DataFrame:
+        # After any concat of row partitions, so open categories span the whole frame
+        if not self.categorical:
+            return output_data
+        if open_categories is None:
+            open_categories = self.open_categories(output_data)
+        for rule in self.rules:
+            if isinstance(rule.output_dtype, pd.CategoricalDtype):
+                output_data[rule.target_field] = cast_output(output_data[rule.target_field], rule.output_dtype)
+            elif rule.target_field in open_categories:
+                output_data[rule.target_field] = output_data[rule.target_field].astype('category')
+        return output_data
+
+    def _apply_rules(self, input_data: pd.DataFrame, executor: Optional[Executor] = None) -> pd.DataFrame:
+        if executor is None:
+            results = [rule.evaluate(input_data) for rule in self.rules]
+        else:
+            futures = [executor.submit(rule.evaluate, input_data) for rule in self.rules]
+            results = [future.result() for future in futures]
+        if not results:
+            return pd.DataFrame()
+        output_columns = {rule.target_field: result for rule, result in zip(self.rules, results)}
+        return pd.DataFrame(output_columns, index=input_data.index)
+
+def _parse_rule_expression(transform_rule: Any) -> Expression:
+    expression = parse_expression(transform_rule)
+    # A lone name is far more likely a misspelt rule than a column copy; use direct for that
+    if isinstance(expression, (Column, Literal)):
+        raise ValueError(f"Unknown transform rule '{transform_rule}'; known rules: {sorted(TRANSFORMS)}, "
+                         f"parameterized rules: {sorted(name + '(...)' for name in TRANSFORM_FACTORIES)}; "
+                         f"expressions need an operator or function call")
+    return expression
+
+def _compile_rule(transform_rule: Any) -> Tuple[Optional[Transform], Optional[str], Optional[Expression]]:
+    """Resolve a named or parameterized rule, falling back to parsing it as an expression"""
+    if not is_named_rule(transform_rule):
+        return None, None, _parse_rule_expression(transform_rule)
+    try:
+        transform, rule_field = resolve_transform(transform_rule)
+        return transform, rule_field, None
+    except ValueError as e:
+        # substr(first_name, 0, 3) is the expression form of the substr(0,3) rule
+        try:
+            return None, None, _parse_rule_expression(transform_rule)
+        except ValueError:
+            raise e
+
+def compile_mapping_plan(mapping: Union[str, pd.DataFrame],
+                         input_columns: Optional[List[str]] = None, categorical: bool = True) -> MappingPlan:
+    """
+    Compile a mapping configuration into a reusable MappingPlan
+
+    Args:
+        mapping (str or DataFrame): Path to mapping Excel file or an already loaded mapping sheet
+        input_columns (list, optional): Input columns to check the source fields against up front
+        categorical (bool): Return low-cardinality target columns as categoricals
+    Returns:
+        MappingPlan: Validated plan with rule names resolved to registered transforms
+            and expression rules parsed into ASTs
+    """
+    if isinstance(mapping, str):
+        if not validate_excel_file(mapping):
+            raise ValueError(f"Invalid Excel file format: {mapping}")
+        if not os.path.exists(mapping):
+            raise FileNotFoundError(f"File not found: {mapping}")
+        try:
+            mapping = pd.read_excel(mapping, engine='openpyxl', sheet_name=0)
+        except Exception as e:
+            print(f"Error reading mapping file: {mapping}")
+            raise
+
+    missing = [column for column in MAPPING_COLUMNS if column not in mapping.columns]
+    if missing:
+        raise ValueError(f"Mapping configuration is missing columns: {missing}")
+
+    rules = []
+    seen_targets = set()
+    for source_field, target_field, transform_rule in mapping[list(MAPPING_COLUMNS)].dropna(how='all').itertuples(index=False):
+        try:
+            transform, rule_field, expression = _compile_rule(transform_rule)
+        except ValueError as e:
+            raise ValueError(f"Target field {target_field}: {e}") from e
+        if rule_field is not None:
+            if pd.notna(source_field) and source_field != rule_field:
+                raise ValueError(f"Target field {target_field}: rule refers to {rule_field} "
+                                 f"but source_field is {source_field}")
+            source_field = rule_field
+        if expression is not None and pd.notna(source_field):
+            referenced = expression_fields(expression)
+            if source_field not in referenced:
+                raise ValueError(f"Target field {target_field}: expression reads {referenced} "
+                                 f"but source_field is {source_field}")
+        if target_field in seen_targets:
+            raise ValueError(f"Duplicate target field in mapping configuration: {target_field}")
+        seen_targets.add(target_field)
+        rules.append(MappingRule(source_field, target_field, transform_rule, transform, expression))
+
+    plan = MappingPlan(tuple(rules), categorical)
+    if input_columns is not None:
+        plan.validate_input(input_columns)
+    return plan
+
+# --- Polars backend -----------------------------------------------------------
+# The pandas path is the reference implementation; every transform and
+# expression is translated to the equivalent Polars expression so a plan runs
+# as a single lazy select. Transforms without a polars_kernel, and text
+# transforms applied to non-text columns (where pandas falls back to mapping
+# single values), run their pandas implementation batch-wise.
+
+# Backends accepted by perform_data_mapping(backend=...)
+BACKENDS = ('pandas', 'polars')
+
+def _polars_pandas_batch(series: Any, transform: Transform, return_dtype: Any = None) -> Any:
+    import polars as pl
+    result = pl.from_pandas(transform(series.to_pandas()))
+    return result if return_dtype is None else result.cast(return_dtype)
+
+def _polars_transform(transform: Transform, expr: Any, dtype: Any = None) -> Any:
+    import polars as pl
+    text_input = dtype is None or dtype == pl.String
+    if transform.polars_kernel is None or (transform.input_dtype == 'text' and not text_input):
+        # Text transforms produce text; Polars cannot infer a UDF's type from an all-null batch
+        return_dtype = pl.String if transform.input_dtype == 'text' else None
+        batch = functools.partial(_polars_pandas_batch, transform=transform, return_dtype=return_dtype)
+        return expr.map_batches(batch, return_dtype=return_dtype, is_elementwise=True)
+    return transform.polars_kernel(expr)
+
+def _polars_text(expr: Any) -> Any:
+    import polars as pl
+    return expr.cast(pl.String)
+
+def _polars_condition(expr: Any) -> Any:
+    return expr.fill_null(False)
+
+def _literal_argument(node: Expression, function: str) -> Any:
+    if not isinstance(node, Literal):
+        raise ValueError(f"The Polars backend needs literal arguments after the first in {function}()")
+    return node.value
+
+def polars_expression(node: Expression, schema: Any) -> Any:
+    """
+    Translate an expression AST into a Polars expression
+
+    Args:
+        node (Expression): Parsed transform_rule expression
+        schema (polars Schema): Input schema, used to pick text or fallback kernels
+    Returns:
+        pl.Expr: Expression equivalent to evaluate_expression() on the same data
+    """
+    import polars as pl
+    if isinstance(node, Column):
+        return pl.col(node.name)
+    if isinstance(node, Literal):
+        return pl.lit(node.value)
+    if isinstance(node, UnaryOp):
+        operand = polars_expression(node.operand, schema)
+        return ~_polars_condition(operand) if node.operator == 'not' else -operand
+    if isinstance(node, BinaryOp):
+        left = polars_expression(node.left, schema)
+        right = polars_expression(node.right, schema)
+        if node.operator == '||':
+            return pl.concat_str([_polars_text(left), _polars_text(right)])
+        if node.operator == 'and':
+            return _polars_condition(left) & _polars_condition(right)
+        if node.operator == 'or':
+            return _polars_condition(left) | _polars_condition(right)
+        return _BINARY_OPERATORS[node.operator](left, right)
+
+    arguments = [polars_expression(argument, schema) for argument in node.arguments]
+    if node.function == 'if':
+        return pl.when(_polars_condition(arguments[0])).then(arguments[1]).otherwise(arguments[2])
+    if node.function == 'coalesce':
+        return pl.coalesce(arguments)
+    if node.function == 'trim':
+        return _polars_text(arguments[0]).str.strip_chars()
+    if node.function == 'length':
+        return _polars_text(arguments[0]).str.len_chars().cast(pl.Int64)
+    if node.function == 'substr':
+        start, length = (_literal_argument(argument, 'substr') for argument in node.arguments[1:])
+        return _polars_substring(_polars_text(arguments[0]), start, length)
+    if node.function == 'split':
+        separator, position = (_literal_argument(argument, 'split') for argument in node.arguments[1:])
+        return _polars_split_part(_polars_text(arguments[0]), separator, position)
+
+    transform = _expression_function(node.function)
+    first = node.arguments[0]
+    dtype = schema.get(first.name) if isinstance(first, Column) else None
+    return _polars_transform(transform, arguments[0], dtype)
+
+def polars_rule_expression(rule: MappingRule, schema: Any) -> Any:
+    """Polars expression producing one rule's target column"""
+    import polars as pl
+    if rule.expression is not None:
+        expr = polars_expression(rule.expression, schema)
+    else:
+        expr = _polars_transform(rule.transform, pl.col(rule.source_field), schema.get(rule.source_field))
+    return expr.alias(rule.target_field)
+
+def scan_input_polars(input_file: str, columns: Optional[List[str]] = None) -> Any:
+    """
+    Open an input file as a Polars LazyFrame
+
+    Parquet, Feather and uncompressed CSV are scanned lazily so only the
+    projected columns are read; Excel and compressed CSV go through read_input().
+    """
+    import polars as pl
+    file_type = input_format(input_file)
+    compressed = input_file.lower().endswith(CSV_COMPRESSION_SUFFIXES)
+    if file_type == 'parquet':
+        lazy_frame = pl.scan_parquet(input_file)
+    elif file_type == 'feather':
+        lazy_frame = pl.scan_ipc(input_file)
+    elif file_type == 'csv' and not compressed:
+        lazy_frame = pl.scan_csv(input_file)
+    else:
+        lazy_frame = pl.from_pandas(read_input(input_file, columns=columns)).lazy()
+    return lazy_frame if columns is None else lazy_frame.select(columns)
+
+def _map_polars(input_file: str, plan: MappingPlan) -> pd.DataFrame:
+    query = plan.to_polars(scan_input_polars(input_file, columns=plan.source_fields))
+    return plan._cast_outputs(query.collect().to_pandas())
+
+def _map_polars_chunks(input_file: str, plan: MappingPlan, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Mapped batches of at most chunk_size rows; only one batch is materialized at a time"""
+    import polars as pl
+    file_type = input_format(input_file)
+    if file_type in ('parquet', 'feather') or (file_type == 'csv' and not input_file.lower().endswith(CSV_COMPRESSION_SUFFIXES)):
+        query = plan.to_polars(scan_input_polars(input_file, columns=plan.source_fields))
+        batches = (batch.to_pandas() for batch in query.collect_batches(chunk_size=chunk_size, engine='streaming'))
+    else:
+        # Inputs Polars cannot scan are streamed by read_input_chunks and mapped chunk by chunk
+        batches = (plan.to_polars(pl.from_pandas(chunk).lazy()).collect().to_pandas()
+                   for chunk in read_input_chunks(input_file, chunk_size, columns=plan.source_fields))
+    return plan.cast_chunks(batches)
+
+def compare_backends(input_file: str, mapping_file: Union[str, MappingPlan], backend: str = 'polars') -> pd.DataFrame:
+    """
+    Differential check of a backend against the pandas reference implementation
+
+    Args:
+        input_file (str): Path to input Excel, Parquet, Feather or CSV file
+        mapping_file (str or MappingPlan): Path to mapping configuration Excel file or a compiled plan
+        backend (str): Backend to compare, one of BACKENDS
+    Returns:
+        DataFrame: One row per target field with the number of rows whose values differ
+            (a missing value only matches a missing value) and both dtypes
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+    plan = mapping_file if isinstance(mapping_file, MappingPlan) else compile_mapping_plan(mapping_file)
+    reference = plan.apply(read_input(input_file, columns=plan.source_fields)).reset_index(drop=True)
+    candidate = _map_polars(input_file, plan) if backend == 'polars' else reference
+    rows = []
+    for field in plan.target_fields:
+        expected = reference[field].astype(object)
+        actual = candidate[field].astype(object)
+        both_missing = expected.isna() & actual.isna()
+        differs = ~(both_missing | (expected == actual).fillna(False))
+        rows.append({'target_field': field, 'mismatches': int(differs.sum()),
+                     'reference_dtype': str(reference[field].dtype), 'backend_dtype': str(candidate[field].dtype)})
+    return pd.DataFrame(rows, columns=['target_field', 'mismatches', 'reference_dtype', 'backend_dtype'])
+
+def _map_chunks_in_pool(plan: MappingPlan, chunks: Iterable[pd.DataFrame], executor: Executor,
+                        in_flight: int) -> Iterator[pd.DataFrame]:
+    """Map chunks with _map_chunk on a process pool in input order, with at most in_flight chunks read ahead"""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(_map_chunk, plan, chunk))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _map_chunk(plan: MappingPlan, chunk: pd.DataFrame, parallel: Optional[str] = None,
+               max_workers: Optional[int] = None, executor: Optional[Executor] = None) -> pd.DataFrame:
+    """MappingPlan.apply without the dtype casts, which MappingPlan.cast_chunks does for the whole stream"""
+    plan.validate_input(chunk.columns)
+    return plan._map(chunk, parallel, max_workers, executor)
+
+def perform_data_mapping(input_file: str, mapping_file: Union[str, MappingPlan], output_file: str,
+                         chunk_size: Optional[int] = None, compression: Optional[str] = None,
+                         parallel: Optional[str] = None, max_workers: Optional[int] = None,
+                         backend: str = 'pandas') -> None:
     """
     Perform data mapping based on mapping configuration from Excel files
     
     Args:
-        input_file (str): Path to input Excel file
-        mapping_file (str): Path to mapping configuration Excel file
-        output_file (str): Path to save mapped data
+        input_file (str): Path to input Excel, Parquet, Feather or CSV file
+        mapping_file (str or MappingPlan): Path to mapping configuration Excel file or a compiled plan
+        output_file (str): Path to save mapped data; the extension selects Excel, Parquet, Feather or CSV
+        chunk_size (int, optional): Stream the input in chunks of this many rows instead of loading it whole
+        compression (str, optional): Compression codec for Parquet, Feather or CSV output
+        parallel (str, optional): 'rules' or 'rows' to spread the mapping over all cores, see MappingPlan.apply;
+            with chunk_size, 'rows' maps whole chunks on the process pool instead of splitting each one
+        max_workers (int, optional): Pool size for parallel execution
+        backend (str): 'pandas', or 'polars' to run the plan as one multithreaded Polars query;
+            with Polars, chunk_size streams batches of that size and parallel does not apply
     """
     try:
         # Validate file extensions
-        for file_path in [input_file, mapping_file]:
-            if not validate_excel_file(file_path):
-                raise ValueError(f"Invalid Excel file format: {file_path}")
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File not found: {file_path}")
+        input_format(input_file)
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"File not found: {input_file}")
+
+        # Fail fast on unsupported output formats
+        output_format(output_file)
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+        if backend == 'polars' and parallel is not None:
+            raise ValueError("parallel applies to the pandas backend; Polars parallelizes the query itself")
+
+        plan = mapping_file if isinstance(mapping_file, MappingPlan) else compile_mapping_plan(mapping_file)
+
+        if backend == 'polars':
+            try:
+                if chunk_size:
+                    write_output_chunks(_map_polars_chunks(input_file, plan, chunk_size), output_file, compression)
+                else:
+                    write_output(_map_polars(input_file, plan), output_file, compression)
+            except Exception as e:
+                print(f"Error mapping input file with Polars: {input_file}")
+                raise
+            print(f"Data mapping completed successfully. Output saved to: {output_file}")
+            return
+
+        if chunk_size:
+            # Each chunk is mapped and written before the next one is read; one pool serves all chunks
+            executor = None
+            if parallel == 'rules':
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+            elif parallel == 'rows':
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            try:
+                input_chunks = read_input_chunks(input_file, chunk_size, columns=plan.source_fields)
+                if parallel == 'rows':
+                    workers = max_workers or os.cpu_count() or 1
+                    output_chunks = _map_chunks_in_pool(plan, input_chunks, executor, 2 * workers)
+                else:
+                    output_chunks = (_map_chunk(plan, chunk, parallel, max_workers, executor)
+                                     for chunk in input_chunks)
+                write_output_chunks(plan.cast_chunks(output_chunks), output_file, compression)
+                print(f"Data mapping completed successfully. Output saved to: {output_file}")
+            except Exception as e:
+                print(f"Error streaming input file {input_file} to output file {output_file}")
+                raise
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+            return
 
-        # Try to read Excel files with error handling
+        # Read only the columns the mapping refers to
         try:
-            input_data = pd.read_excel(input_file, engine='openpyxl', sheet_name=0)
+            input_data = read_input(input_file, columns=plan.source_fields)
         except Exception as e:
             print(f"Error reading input file: {input_file}")
             raise
 
-        try:
-            mapping_config = pd.read_excel(mapping_file, engine='openpyxl', sheet_name=0)
-        except Exception as e:
-            print(f"Error reading mapping file: {mapping_file}")
-            raise
-        
-        # Create output dataframe
-        output_data = pd.DataFrame()
-        
-        def extract_domain(email):
-            return email.split('@')[1] if '@' in email else ''
-        
-        def age_category(age):
-            if age < 30:
-                return 'Young'
-            elif age < 45:
-                return 'Middle'
-            else:
-                return 'Senior'
-        
-        # Apply mapping rules
-        for _, mapping in mapping_config.iterrows():
-            source_field = mapping['source_field']
-            target_field = mapping['target_field']
-            transform_rule = mapping['transform_rule']
-            
-            if transform_rule == 'direct':
-                output_data[target_field] = input_data[source_field]
-            elif transform_rule == 'uppercase':
-                output_data[target_field] = input_data[source_field].str.upper()
-            elif transform_rule == 'lowercase':
-                output_data[target_field] = input_data[source_field].str.lower()
-            elif transform_rule == 'first_three_chars':
-                output_data[target_field] = input_data[source_field].str[:3]
-            elif transform_rule == 'extract_domain':
-                output_data[target_field] = input_data[source_field].apply(extract_domain)
-            elif transform_rule == 'age_category':
-                output_data[target_field] = input_data[source_field].apply(age_category)
-            elif transform_rule == 'before_at':
-                output_data[target_field] = input_data[source_field].str.split('@').str[0]
-            elif transform_rule == 'first_letter':
-                output_data[target_field] = input_data[source_field].str[0]
+        output_data = plan.apply(input_data, parallel, max_workers)
         
         # Save with error handling
         try:
-            output_data.to_excel(output_file, index=False, engine='openpyxl')
+            write_output(output_data, output_file, compression)
             print(f"Data mapping completed successfully. Output saved to: {output_file}")
         except Exception as e:
             print(f"Error saving output file: {output_file}")
@@ -86,48 +1814,890 @@ def perform_data_mapping(input_file: str, mapping_file: str, output_file: str) -
         print(f"Error occurred during data mapping: {str(e)}")
         raise
 
-def analyze_data_structure(file_path: str) -> Dict:
+def collect_input_files(inputs: Union[str, List[str]]) -> List[str]:
     """
-    Analyze data structure of an Excel file and suggest mappings
-    
+    Expand a directory, glob pattern or list of paths into supported input files
+
     Args:
-        file_path (str): Path to Excel file to analyze
+        inputs (str or list): Directory, glob pattern (e.g. 'regions/*.xlsx') or list of file paths
     Returns:
-        Dict: Analysis results including data types and patterns
+        List[str]: Sorted input file paths
     """
+    if not isinstance(inputs, str):
+        return list(inputs)
+    if os.path.isdir(inputs):
+        candidates = [os.path.join(inputs, name) for name in os.listdir(inputs)]
+    else:
+        candidates = glob.glob(inputs)
+    files = []
+    for path in candidates:
+        # Skip Excel lock files and anything we cannot read
+        if not os.path.isfile(path) or os.path.basename(path).startswith('~$'):
+            continue
+        try:
+            input_format(path)
+        except ValueError:
+            continue
+        files.append(path)
+    return sorted(files)
+
+def _batch_output_file(input_file: str, output_dir: str, output_ext: str) -> str:
+    name = os.path.basename(input_file)
+    root, ext = os.path.splitext(name)
+    if ext.lower() in CSV_COMPRESSION_SUFFIXES:
+        root = os.path.splitext(root)[0]
+    return os.path.join(output_dir, root + output_ext)
+
+def _map_file(input_file: str, plan: MappingPlan, output_file: str,
+              chunk_size: Optional[int], compression: Optional[str]) -> Dict[str, Any]:
+    """Batch worker: map one file and report the outcome instead of raising"""
     try:
-        df = pd.read_excel(file_path, engine='openpyxl')
-        analysis = {
-            'columns': {},
-            'suggested_mappings': {}
+        perform_data_mapping(input_file, plan, output_file, chunk_size=chunk_size, compression=compression)
+        return {'input_file': input_file, 'output_file': output_file, 'status': 'success', 'error': None}
+    except Exception as e:
+        return {'input_file': input_file, 'output_file': output_file, 'status': 'failed',
+                'error': f"{type(e).__name__}: {e}"}
+
+def batch_data_mapping(inputs: Union[str, List[str]], mapping_file: Union[str, MappingPlan], output_dir: str,
+                       output_ext: str = '.xlsx', max_workers: Optional[int] = None,
+                       chunk_size: Optional[int] = None, compression: Optional[str] = None) -> pd.DataFrame:
+    """
+    Map many input files with one compiled mapping, spread over a process pool
+
+    A failing file is recorded in the summary and does not stop the batch.
+
+    Args:
+        inputs (str or list): Directory, glob pattern or list of input files
+        mapping_file (str or MappingPlan): Path to mapping configuration Excel file or a compiled plan
+        output_dir (str): Directory for the outputs, one per input, named after the input file
+        output_ext (str): Output extension, which selects the output format
+        max_workers (int, optional): Number of worker processes; defaults to the CPU count, 1 runs in-process
+        chunk_size (int, optional): Stream each input in chunks of this many rows
+        compression (str, optional): Compression codec for Parquet, Feather or CSV output
+    Returns:
+        DataFrame: One row per input with input_file, output_file, status and error
+    """
+    input_files = collect_input_files(inputs)
+    plan = mapping_file if isinstance(mapping_file, MappingPlan) else compile_mapping_plan(mapping_file)
+    # Fail fast on an unsupported output extension
+    output_format('output' + output_ext)
+    os.makedirs(output_dir, exist_ok=True)
+
+    output_files = [_batch_output_file(path, output_dir, output_ext) for path in input_files]
+    duplicates = sorted({path for path in output_files if output_files.count(path) > 1})
+    if duplicates:
+        raise ValueError(f"Several inputs would write the same output file: {duplicates}")
+
+    if max_workers == 1 or len(input_files) <= 1:
+        results = [_map_file(path, plan, output_file, chunk_size, compression)
+                   for path, output_file in zip(input_files, output_files)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_map_file, path, plan, output_file, chunk_size, compression)
+                       for path, output_file in zip(input_files, output_files)]
+            results = []
+            for path, output_file, future in zip(input_files, output_files, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory)
+                    results.append({'input_file': path, 'output_file': output_file, 'status': 'failed',
+                                    'error': f"{type(e).__name__}: {e}"})
+
+    summary = pd.DataFrame(results, columns=['input_file', 'output_file', 'status', 'error'])
+    failed = int((summary['status'] == 'failed').sum())
+    print(f"Batch mapping finished: {len(summary) - failed} succeeded, {failed} failed")
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point for batch mapping; returns a non-zero exit code if any file failed"""
+    parser = argparse.ArgumentParser(description="Map a directory or glob of input files with one mapping sheet")
+    parser.add_argument('inputs', help="Input directory or glob pattern, e.g. 'regions/*.xlsx'")
+    parser.add_argument('mapping_file', help="Mapping configuration Excel file")
+    parser.add_argument('output_dir', help="Directory to write one output per input")
+    parser.add_argument('--output-ext', default='.xlsx', help="Output extension selecting the format (default: .xlsx)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=None, help="Stream inputs in chunks of this many rows")
+    parser.add_argument('--compression', default=None, help="Compression codec for Parquet, Feather or CSV output")
+    args = parser.parse_args(argv)
+
+    summary = batch_data_mapping(args.inputs, args.mapping_file, args.output_dir, output_ext=args.output_ext,
+                                 max_workers=args.workers, chunk_size=args.chunk_size,
+                                 compression=args.compression)
+    for row in summary[summary['status'] == 'failed'].itertuples(index=False):
+        print(f"FAILED {row.input_file}: {row.error}")
+    return 1 if (summary['status'] == 'failed').any() else 0
+
+# Bump when the analysis result layout changes so stale cache entries are ignored
+ANALYSIS_CACHE_VERSION = 5
+
+# MinHash sketch size per column: estimates have a standard error of about 1/sqrt(MINHASH_SIZE)
+MINHASH_SIZE = 128
+# Rows per LSH band; columns sharing any band become reverse engineering candidates
+MINHASH_BAND_SIZE = 4
+# Hashed values processed at once, which bounds the scratch memory of minhash_signature
+MINHASH_BLOCK_SIZE = 65536
+
+_MINHASH_RANDOM = np.random.default_rng(20240611)
+_MINHASH_A = _MINHASH_RANDOM.integers(1, 2 ** 63, MINHASH_SIZE, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_MINHASH_B = _MINHASH_RANDOM.integers(0, 2 ** 63, MINHASH_SIZE, dtype=np.uint64)
+
+def _normalized_values(series: pd.Series) -> pd.Series:
+    """Non-missing values as case-folded strings, with integral floats written like integers"""
+    values = series.dropna()
+    if pd.api.types.is_float_dtype(values.dtype) and (values % 1 == 0).all():
+        values = values.astype('int64')
+    return values.astype(str).str.strip().str.casefold()
+
+def minhash_signature(series: pd.Series) -> Optional[np.ndarray]:
+    """
+    MinHash sketch of the distinct values of a column
+
+    The sketch has MINHASH_SIZE entries whatever the column length, and two
+    sketches estimate the Jaccard overlap of the value sets (see
+    estimate_jaccard). Values are compared case-insensitively.
+
+    Args:
+        series (Series): Column to sketch
+    Returns:
+        ndarray or None: uint64 sketch, or None for a column without values
+    """
+    values = _normalized_values(series)
+    if values.empty:
+        return None
+    hashes = np.unique(pd.util.hash_array(values.to_numpy(dtype=object)))
+    signature = np.full(MINHASH_SIZE, np.iinfo(np.uint64).max, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for start in range(0, len(hashes), MINHASH_BLOCK_SIZE):
+            block = hashes[start:start + MINHASH_BLOCK_SIZE]
+            # Universal hashing modulo 2**64 gives one permutation per sketch entry
+            permuted = _MINHASH_A[:, None] * block[None, :] + _MINHASH_B[:, None]
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature
+
+def estimate_jaccard(signature_a: Optional[np.ndarray], signature_b: Optional[np.ndarray]) -> float:
+    """Estimated Jaccard overlap of two columns' value sets from their MinHash sketches"""
+    if signature_a is None or signature_b is None:
+        return 0.0
+    return float(np.mean(signature_a == signature_b))
+
+# HyperLogLog registers = 2 ** HLL_PRECISION; relative standard error is 1.04 / sqrt(registers)
+HLL_PRECISION = 14
+
+def _value_hashes(values: pd.Series) -> np.ndarray:
+    """uint64 hash of each value, equal for equal values whatever the column's dtype"""
+    # categorize=False hashes rows directly instead of factorizing first
+    return pd.util.hash_array(values.to_numpy(dtype=object), categorize=False)
+
+class HyperLogLog:
+    """
+    Mergeable approximate distinct counter
+
+    Memory is 2 ** precision bytes whatever the number of values added.
+    Sketches built on different chunks, files or processes combine with merge().
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of estimate()"""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, series: pd.Series) -> 'HyperLogLog':
+        """Add the non-missing values of a column"""
+        values = series.dropna()
+        if values.empty:
+            return self
+        return self.update_hashes(_value_hashes(values))
+
+    def update_hashes(self, hashes: np.ndarray) -> 'HyperLogLog':
+        """Add values already hashed with _value_hashes"""
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Rank = position of the first set bit after the index bits; the top 53 bits convert to float exactly
+        remainder = (hashes << np.uint64(self.precision)) >> np.uint64(11)
+        bit_length = np.frexp(remainder.astype(np.float64))[1]
+        rank = np.where(remainder > 0, 54 - bit_length, 54).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Combine another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge HyperLogLog sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        """Estimated number of distinct values added"""
+        registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        raw = alpha * registers ** 2 / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if raw <= 2.5 * registers and empty:
+            return float(registers * np.log(registers / empty))
+        return float(raw)
+
+# Sampling strategies accepted by analyze_data_structure(sample=...)
+SAMPLING_STRATEGIES = ('head', 'reservoir', 'stratified')
+
+# Rows profiled when sampling; plenty for suggesting mappings
+DEFAULT_SAMPLE_SIZE = 100000
+
+def count_rows(data: Union[str, pd.DataFrame]) -> int:
+    """Number of data rows, from file metadata where the format has it"""
+    if isinstance(data, pd.DataFrame):
+        return len(data)
+    file_type = input_format(data)
+    if file_type == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(data).metadata.num_rows
+    if file_type == 'feather':
+        import pyarrow as pa
+        reader = pa.ipc.open_file(pa.memory_map(data))
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    if file_type == 'excel':
+        workbook = load_workbook(data, read_only=True)
+        try:
+            max_row = workbook.worksheets[0].max_row
+        finally:
+            workbook.close()
+        if max_row is not None:
+            return max(max_row - 1, 0)
+    # CSV, or a workbook without stored dimensions: count while parsing a single column
+    return sum(len(chunk) for chunk in read_input_chunks(data, DEFAULT_CHUNK_SIZE, columns=_first_column(data)))
+
+def _first_column(data: str) -> Optional[List[str]]:
+    header = next(read_input_chunks(data, 1), None)
+    return None if header is None else list(header.columns[:1])
+
+def sample_rows(data: Union[str, pd.DataFrame], strategy: str = 'head', sample_size: int = DEFAULT_SAMPLE_SIZE,
+                columns: Optional[List[str]] = None, random_state: int = 0) -> Tuple[pd.DataFrame, Optional[int]]:
+    """
+    Draw a row sample from a file or DataFrame
+
+    'head' takes the first rows and stops reading. 'reservoir' streams
+    every chunk and keeps a uniform sample (bottom-k on random keys).
+    'stratified' takes the same share of rows from every chunk, so each
+    region of the file is represented.
+
+    Args:
+        data (str or DataFrame): File path or loaded data
+        strategy (str): One of SAMPLING_STRATEGIES
+        sample_size (int): Rows to keep
+        columns (list, optional): Only load these columns
+        random_state (int): Seed for reproducible samples
+    Returns:
+        Tuple: Sampled rows in file order, and the total row count when it is known
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Unknown sampling strategy: {strategy}, expected one of {SAMPLING_STRATEGIES}")
+    if isinstance(data, pd.DataFrame) and columns is not None:
+        data = data[list(columns)]
+    if strategy == 'head':
+        if isinstance(data, pd.DataFrame):
+            return data.head(sample_size), len(data)
+        return next(read_input_chunks(data, sample_size, columns=columns)), None
+
+    rng = np.random.default_rng(random_state)
+    total_rows = count_rows(data) if strategy == 'stratified' else None
+    fraction = 1.0 if not total_rows else min(1.0, sample_size / total_rows)
+    kept, keys = [], []
+    seen = 0
+    for chunk in _iter_frames(data, columns):
+        seen += len(chunk)
+        if strategy == 'stratified':
+            take = int(round(len(chunk) * fraction))
+            positions = np.sort(rng.choice(len(chunk), size=min(take, len(chunk)), replace=False))
+            kept.append(chunk.iloc[positions])
+            continue
+        # Reservoir: the sample_size rows with the smallest random keys are a uniform sample
+        kept.append(chunk)
+        keys.append(rng.random(len(chunk)))
+        pool, pool_keys = pd.concat(kept), np.concatenate(keys)
+        if len(pool) > sample_size:
+            best = np.sort(np.argpartition(pool_keys, sample_size)[:sample_size])
+            pool, pool_keys = pool.iloc[best], pool_keys[best]
+        kept, keys = [pool], [pool_keys]
+    sample = pd.concat(kept) if kept else pd.DataFrame(columns=columns)
+    return sample, seen
+
+# Values kept per column by the streaming profiler's uniform reservoir
+PROFILE_RESERVOIR_SIZE = 100
+
+def _merge_dtype(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    """dtype of a column whose chunks were read as first and second"""
+    if first is None or first == second:
+        return second
+    if second is None:
+        return first
+    numeric = ('int64', 'float64', 'Int64', 'Float64')
+    if first in numeric and second in numeric:
+        return 'float64'
+    return 'object'
+
+class ColumnProfile:
+    """
+    Mergeable statistics of one column, updated chunk by chunk
+
+    Holds counts, a HyperLogLog distinct sketch, a MinHash sketch, the
+    pattern flags and pattern library match counts, min/max and a uniform
+    reservoir of values, all in constant memory. Profiles of different
+    chunks, files or worker processes combine with merge(); their reservoirs
+    need different seeds (e.g. SeedSequence.spawn) for the merge to stay uniform.
+    """
+
+    def __init__(self, random_state: Union[int, np.random.SeedSequence] = 0):
+        self.rows = 0
+        self.missing = 0
+        self.dtype = None
+        self.distinct = HyperLogLog()
+        self.minhash = None
+        self.has_text = False
+        self.flags = {'has_email': False, 'all_uppercase': True, 'all_lowercase': True, 'numeric_only': True}
+        self.pattern_counts = defaultdict(int)
+        self.pattern_rows = 0
+        self.minimum = None
+        self.maximum = None
+        self.head = []
+        self.reservoir = pd.DataFrame({'value': pd.Series(dtype=object), 'key': pd.Series(dtype=float)})
+        self.rng = np.random.default_rng(random_state)
+
+    def update(self, series: pd.Series) -> 'ColumnProfile':
+        """Add one chunk of the column"""
+        present = series.dropna()
+        self.rows += len(series)
+        self.missing += len(series) - len(present)
+        if len(self.head) < 5:
+            self.head.extend(series.head(5 - len(self.head)).tolist())
+        if present.empty:
+            # An all-missing chunk says nothing about the column's type
+            return self
+
+        self.dtype = _merge_dtype(self.dtype, str(series.dtype))
+        # The sketches and pattern checks only depend on the chunk's distinct values
+        codes, distinct = pd.factorize(present)
+        distinct_values = pd.Series(distinct)
+        self.distinct.update(distinct_values)
+        self.minhash = _merge_minhash(self.minhash, minhash_signature(distinct_values))
+        if _has_pattern_flags(series.dtype):
+            self._merge_flags(True, _distinct_pattern_flags(distinct_values))
+        counts, rows = _pattern_counts(present, factorized=(codes, distinct))
+        for name, count in counts.items():
+            self.pattern_counts[name] += count
+        self.pattern_rows += rows
+        try:
+            low, high = present.min(), present.max()
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+        except TypeError:
+            # Mixed types have no order
+            pass
+        sampled = pd.DataFrame({'value': present.to_numpy(dtype=object), 'key': self.rng.random(len(present))})
+        self._merge_reservoir(sampled)
+        return self
+
+    def merge(self, other: 'ColumnProfile') -> 'ColumnProfile':
+        """Combine the profile of another chunk, file or worker into this one"""
+        self.rows += other.rows
+        self.missing += other.missing
+        self.head = (self.head + other.head)[:5]
+        self.dtype = _merge_dtype(self.dtype, other.dtype)
+        self.distinct.merge(other.distinct)
+        self.minhash = _merge_minhash(self.minhash, other.minhash)
+        if other.has_text:
+            self._merge_flags(True, other.flags)
+        for name, count in other.pattern_counts.items():
+            self.pattern_counts[name] += count
+        self.pattern_rows += other.pattern_rows
+        for bound, pick in (('minimum', min), ('maximum', max)):
+            mine, theirs = getattr(self, bound), getattr(other, bound)
+            try:
+                setattr(self, bound, theirs if mine is None else mine if theirs is None else pick(mine, theirs))
+            except TypeError:
+                pass
+        self._merge_reservoir(other.reservoir)
+        return self
+
+    def _merge_flags(self, has_text: bool, flags: Dict) -> None:
+        self.has_text = self.has_text or has_text
+        self.flags['has_email'] = self.flags['has_email'] or bool(flags['has_email'])
+        for flag in ('all_uppercase', 'all_lowercase', 'numeric_only'):
+            self.flags[flag] = self.flags[flag] and bool(flags[flag])
+
+    def _merge_reservoir(self, sampled: pd.DataFrame) -> None:
+        # Bottom-k on random keys stays a uniform sample after any number of merges
+        combined = pd.concat([self.reservoir, sampled], ignore_index=True) if len(self.reservoir) else sampled
+        self.reservoir = combined.nsmallest(PROFILE_RESERVOIR_SIZE, 'key').reset_index(drop=True)
+
+    def result(self) -> Dict:
+        """Column analysis in the format of analyze_data_structure, plus the streaming statistics"""
+        # pd.read_excel and pd.read_csv load a column without any value as float64
+        dtype = self.dtype or 'float64'
+        estimate = self.distinct.estimate()
+        margin = 2 * self.distinct.relative_error * estimate
+        return {
+            'data_type': dtype,
+            'unique_values': int(round(estimate)),
+            'sample_values': list(self.head),
+            'patterns': dict(self.flags) if self.has_text else
+                        {'has_email': False, 'all_uppercase': False, 'all_lowercase': False, 'numeric_only': False},
+            'pattern_ratios': {name: (self.pattern_counts[name] / self.pattern_rows if self.pattern_rows else 0.0)
+                               for name in PATTERN_LIBRARY},
+            'minhash': self.minhash,
+            'error_bounds': {'unique_values': (max(int(estimate - margin), 0), int(np.ceil(estimate + margin))),
+                             'pattern_violation_rate': 0.0},
+            'count': self.rows - self.missing,
+            'missing': self.missing,
+            'min': self.minimum,
+            'max': self.maximum,
+            'reservoir': self.reservoir['value'].tolist()
         }
-        
-        for column in df.columns:
-            column_analysis = {
-                'data_type': str(df[column].dtype),
-                'unique_values': df[column].nunique(),
-                'sample_values': df[column].head().tolist(),
-                'patterns': detect_patterns(df[column])
-            }
-            analysis['columns'][column] = column_analysis
-            analysis['suggested_mappings'][column] = suggest_transformation(column_analysis)
-            print("within analyze_data_structure for loop")
-            print(analysis['suggested_mappings'][column])
-        
+
+def _distinct_pattern_flags(values: pd.Series) -> Dict:
+    """_pattern_flags of a text column's distinct values, with vectorized .str methods"""
+    # Non-string values are NaN for the .str methods and do not count, as in _pattern_flags
+    text = values.astype(object)
+    if not text.map(lambda value: isinstance(value, str)).any():
+        # The .str accessor rejects columns without any string
+        return {'has_email': False, 'all_uppercase': True, 'all_lowercase': True, 'numeric_only': True}
+    return {
+        'has_email': bool(text.str.contains('@', regex=False).fillna(False).astype(bool).any()),
+        'all_uppercase': bool(text.str.isupper().dropna().astype(bool).all()),
+        'all_lowercase': bool(text.str.islower().dropna().astype(bool).all()),
+        'numeric_only': bool(text.str.isnumeric().dropna().astype(bool).all())
+    }
+
+def _merge_minhash(first: Optional[np.ndarray], second: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """MinHash of the union of two value sets"""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return np.minimum(first, second)
+
+def profile_chunks(chunks: Iterable[pd.DataFrame],
+                   random_state: Union[int, np.random.SeedSequence] = 0) -> Dict[str, ColumnProfile]:
+    """
+    Build mergeable column profiles from a stream of chunks
+
+    Args:
+        chunks (Iterable[DataFrame]): Row chunks, e.g. from read_input_chunks
+        random_state (int or SeedSequence): Seed for the value reservoirs; each column gets its own child seed
+    Returns:
+        Dict[str, ColumnProfile]: Profile per column, in first-seen column order
+    """
+    seeds = random_state if isinstance(random_state, np.random.SeedSequence) else np.random.SeedSequence(random_state)
+    profiles = {}
+    for chunk in chunks:
+        for column in chunk.columns:
+            if column not in profiles:
+                profiles[column] = ColumnProfile(seeds.spawn(1)[0])
+            profiles[column].update(chunk[column])
+    return profiles
+
+def merge_profiles(first: Dict[str, ColumnProfile], second: Dict[str, ColumnProfile]) -> Dict[str, ColumnProfile]:
+    """Combine the column profiles of two chunks, files or workers; columns missing on one side are kept"""
+    merged = dict(first)
+    for column, profile in second.items():
+        merged[column] = merged[column].merge(profile) if column in merged else profile
+    return merged
+
+def _profile_file(file_path: str, columns: Optional[List[str]], chunk_size: int,
+                  seed: np.random.SeedSequence) -> Dict[str, ColumnProfile]:
+    return profile_chunks(read_input_chunks(file_path, chunk_size, columns=columns), seed)
+
+def profile_files(inputs: Union[str, List[str]], columns: Optional[List[str]] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: Optional[int] = None,
+                  random_state: int = 0) -> Dict:
+    """
+    Profile a directory, glob or list of files as if they were one table
+
+    Each file is streamed in chunks by a worker process and the per-file
+    profiles are merged, so memory per worker stays bounded by chunk_size.
+
+    Args:
+        inputs (str or list): Directory, glob pattern or list of files
+        columns (list, optional): Only profile these columns
+        chunk_size (int): Rows per chunk
+        max_workers (int, optional): Worker processes; 1 profiles in-process
+        random_state (int): Seed for the value reservoirs; every file gets its own child seed
+    Returns:
+        Dict: Analysis results in the format of analyze_data_structure
+    """
+    input_files = collect_input_files(inputs)
+    seeds = np.random.SeedSequence(random_state).spawn(len(input_files))
+    if max_workers == 1 or len(input_files) <= 1:
+        partials = [_profile_file(path, columns, chunk_size, seed) for path, seed in zip(input_files, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            partials = list(executor.map(_profile_file, input_files, [columns] * len(input_files),
+                                         [chunk_size] * len(input_files), seeds))
+    profiles = {}
+    for partial in partials:
+        profiles = merge_profiles(profiles, partial)
+    return _analysis_from_profiles(profiles)
+
+def _analysis_from_profiles(profiles: Dict[str, ColumnProfile]) -> Dict:
+    analysis = {
+        'columns': {},
+        'suggested_mappings': {}
+    }
+    for column, profile in profiles.items():
+        _add_column_analysis(analysis, column, profile.result())
+    rows = next(iter(profiles.values())).rows if profiles else 0
+    analysis['profile'] = {'sample': None, 'sampled_rows': rows, 'total_rows': rows, 'approximate': True}
+    return analysis
+
+def file_content_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _analysis_cache_path(file_path: str, columns: Optional[List[str]], cache_dir: str, options: Tuple) -> str:
+    key = hashlib.sha256(repr((ANALYSIS_CACHE_VERSION, file_content_hash(file_path),
+                               None if columns is None else list(columns), options)).encode()).hexdigest()
+    return os.path.join(cache_dir, f"analysis_{key}.pkl")
+
+def analyze_data_structure(data: Union[str, pd.DataFrame], columns: Optional[List[str]] = None,
+                           cache_dir: Optional[str] = None, sample: Optional[str] = None,
+                           sample_size: int = DEFAULT_SAMPLE_SIZE, approximate: bool = False,
+                           random_state: int = 0, chunk_size: Optional[int] = None) -> Dict:
+    """
+    Analyze data structure of a data file and suggest mappings
+    
+    Args:
+        data (str or DataFrame): Path to Excel, Parquet, Feather or CSV file, or already loaded data
+        columns (list, optional): Only load and analyze these columns
+        cache_dir (str, optional): Directory caching results by file content hash; unchanged files are not re-read
+        sample (str, optional): Profile a row sample instead of everything: 'head', 'reservoir' or 'stratified'
+        sample_size (int): Rows to profile when sampling
+        approximate (bool): Estimate unique_values with a mergeable HyperLogLog sketch of each
+            column's distinct values and take the pattern library ratios from its first rows
+        random_state (int): Seed for the reservoir and stratified samples
+        chunk_size (int, optional): Without sampling, stream the data in chunks of this many rows
+            through mergeable column profiles (see profile_chunks); unique_values is then a
+            HyperLogLog estimate and each column also reports count, missing, min, max and reservoir
+    Returns:
+        Dict: Analysis results including data types and patterns; every column carries
+            'error_bounds' and the top-level 'profile' entry describes how it was computed
+    """
+    try:
+        streaming = sample is None and chunk_size is not None
+        options = (sample, sample_size if sample else None, approximate, random_state if sample else None,
+                   chunk_size if streaming else None)
+        cache_path = None
+        if cache_dir is not None and not isinstance(data, pd.DataFrame):
+            cache_path = _analysis_cache_path(data, columns, cache_dir, options)
+            if os.path.exists(cache_path):
+                with open(cache_path, 'rb') as handle:
+                    return pickle.load(handle)
+
+        if streaming:
+            if isinstance(data, pd.DataFrame):
+                frame = data if columns is None else data[list(columns)]
+                chunks = (frame.iloc[start:start + chunk_size] for start in range(0, len(frame), chunk_size))
+            else:
+                chunks = read_input_chunks(data, chunk_size, columns=columns)
+            analysis = _analysis_from_profiles(profile_chunks(chunks, random_state))
+        elif sample is None:
+            if isinstance(data, pd.DataFrame):
+                df = data if columns is None else data[list(columns)]
+            else:
+                df = read_input(data, columns=columns)
+            total_rows = len(df)
+        else:
+            df, total_rows = sample_rows(data, sample, sample_size, columns=columns, random_state=random_state)
+
+        if not streaming:
+            analysis = _analyze_frame(df, approximate=approximate, sampled=sample is not None, total_rows=total_rows)
+            analysis['profile'] = {'sample': sample, 'sampled_rows': len(df), 'total_rows': total_rows,
+                                   'approximate': approximate}
+
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial entry
+            temp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as handle:
+                pickle.dump(analysis, handle)
+            os.replace(temp_path, cache_path)
         return analysis
     except Exception as e:
         print(f"Error analyzing data structure: {str(e)}")
         raise
 
+def _analyze_frame(df: pd.DataFrame, approximate: bool = False, sampled: bool = False,
+                   total_rows: Optional[int] = None) -> Dict:
+    analysis = {
+        'columns': {},
+        'suggested_mappings': {}
+    }
+    
+    for column in df.columns:
+        column_analysis = profile_column(df[column], approximate=approximate)
+        if sampled:
+            _widen_for_sample(column_analysis, len(df), total_rows)
+        _add_column_analysis(analysis, column, column_analysis)
+    
+    return analysis
+
+def _add_column_analysis(analysis: Dict, column: str, column_analysis: Dict) -> None:
+    analysis['columns'][column] = column_analysis
+    analysis['suggested_mappings'][column] = suggest_transformation(column_analysis)
+    print("within analyze_data_structure for loop")
+    print(analysis['suggested_mappings'][column])
+
+def _widen_for_sample(column_analysis: Dict, sampled_rows: int, total_rows: Optional[int]) -> None:
+    """Turn bounds computed on a sample into bounds for the whole file"""
+    low, high = column_analysis['error_bounds']['unique_values']
+    # Every unsampled row may add one more distinct value
+    unseen = None if total_rows is None else max(total_rows - sampled_rows, 0)
+    column_analysis['error_bounds']['unique_values'] = (low, None if unseen is None else high + unseen)
+    # Rule of three: with no counterexample in n rows, the violation rate is below 3/n at 95% confidence
+    column_analysis['error_bounds']['pattern_violation_rate'] = min(1.0, 3 / sampled_rows) if sampled_rows else 1.0
+
+def profile_column(series: pd.Series, approximate: bool = False) -> Dict:
+    """
+    Profile one column with a single scan over its values
+
+    The column is factorized once; the distinct count, the pattern flags and
+    the MinHash sketch are then all derived from the distinct values, which
+    give the same any/all answers as scanning every row. Approximate mode
+    skips the factorization: the values are hashed block by block into a
+    HyperLogLog sketch (which merges with other sketches) and per-block
+    MinHash sketches, the pattern flags stop being checked once
+    counterexamples have decided them, and the pattern library
+    ratios come from the first APPROXIMATE_PATTERN_ROWS values.
+
+    Args:
+        series (Series): Column to profile
+        approximate (bool): Use the approximate mode described above
+    Returns:
+        Dict: data_type, unique_values, sample_values, patterns, pattern_ratios (share of values
+            matching each PATTERN_LIBRARY pattern), minhash and error_bounds (an interval for unique_values and an upper bound on the rate of rows breaking
+            the all_* pattern flags)
+    """
+    if approximate:
+        present = series.dropna()
+        sketch = HyperLogLog()
+        patterns = _pattern_flags([], series.dtype)
+        minhash = None
+        for start in range(0, len(present), APPROXIMATE_BLOCK_ROWS):
+            block = present.iloc[start:start + APPROXIMATE_BLOCK_ROWS]
+            hashes = _value_hashes(block)
+            sketch.update_hashes(hashes)
+            # MinHash and the flags only depend on the block's value set: one row per hash is enough
+            block = block.iloc[np.unique(hashes, return_index=True)[1]]
+            minhash = _merge_minhash(minhash, minhash_signature(block))
+            if _has_pattern_flags(series.dtype) and not _flags_decided(patterns):
+                block_flags = _distinct_pattern_flags(block)
+                patterns = {flag: (patterns[flag] or block_flags[flag]) if flag == 'has_email'
+                            else patterns[flag] and block_flags[flag] for flag in patterns}
+        estimate = sketch.estimate()
+        margin = 2 * sketch.relative_error * estimate
+        unique_values = int(round(estimate))
+        bounds = (max(int(estimate - margin), 0), int(np.ceil(estimate + margin)))
+        pattern_ratios = pattern_match_ratios(present.head(APPROXIMATE_PATTERN_ROWS))
+    else:
+        codes, distinct = pd.factorize(series)
+        patterns = _pattern_flags(distinct, series.dtype)
+        minhash = minhash_signature(pd.Series(distinct))
+        unique_values = len(distinct)
+        bounds = (unique_values, unique_values)
+        pattern_ratios = pattern_match_ratios(series, factorized=(codes, distinct))
+    return {
+        'data_type': str(series.dtype),
+        'unique_values': unique_values,
+        'sample_values': series.head().tolist(),
+        'patterns': patterns,
+        'pattern_ratios': pattern_ratios,
+        'minhash': minhash,
+        'error_bounds': {'unique_values': bounds, 'pattern_violation_rate': 0.0}
+    }
+
+def _flags_decided(patterns: Dict) -> bool:
+    """True once no further value can change the pattern flags"""
+    return patterns['has_email'] and not (patterns['all_uppercase'] or patterns['all_lowercase']
+                                          or patterns['numeric_only'])
+
+def _is_text_dtype(dtype) -> bool:
+    """Object columns and pandas string columns (the default for text from pandas 3)"""
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+def _has_pattern_flags(dtype) -> bool:
+    """Columns checked for the pattern flags: object columns only, as in the original detect_patterns"""
+    return dtype == object
+
+def _pattern_flags(values: Iterable, dtype) -> Dict:
+    """Pattern flags over the given values (all rows or just the distinct ones), all four checked in one loop"""
+    has_email = all_uppercase = all_lowercase = numeric_only = False
+    if _has_pattern_flags(dtype):
+        all_uppercase = all_lowercase = numeric_only = True
+        for value in values:
+            # Non-string values are NaN for the .str methods and do not count
+            if not isinstance(value, str):
+                continue
+            if not has_email and '@' in value:
+                has_email = True
+            if all_uppercase and not value.isupper():
+                all_uppercase = False
+            if all_lowercase and not value.islower():
+                all_lowercase = False
+            if numeric_only and not value.isnumeric():
+                numeric_only = False
+            if has_email and not (all_uppercase or all_lowercase or numeric_only):
+                break
+    return {
+        'has_email': has_email,
+        'all_uppercase': all_uppercase,
+        'all_lowercase': all_lowercase,
+        'numeric_only': numeric_only
+    }
+
+# ISO 3166-1 alpha-2 country codes
+ISO_COUNTRY_CODES = (
+    'AD AE AF AG AI AL AM AO AQ AR AS AT AU AW AX AZ BA BB BD BE BF BG BH BI BJ BL BM BN BO BQ BR BS BT BV BW '
+    'BY BZ CA CC CD CF CG CH CI CK CL CM CN CO CR CU CV CW CX CY CZ DE DJ DK DM DO DZ EC EE EG EH ER ES ET FI '
+    'FJ FK FM FO FR GA GB GD GE GF GG GH GI GL GM GN GP GQ GR GS GT GU GW GY HK HM HN HR HT HU ID IE IL IM IN '
+    'IO IQ IR IS IT JE JM JO JP KE KG KH KI KM KN KP KR KW KY KZ LA LB LC LI LK LR LS LT LU LV LY MA MC MD ME '
+    'MF MG MH MK ML MM MN MO MP MQ MR MS MT MU MV MW MX MY MZ NA NC NE NF NG NI NL NO NP NR NU NZ OM PA PE PF '
+    'PG PH PK PL PM PN PR PS PT PW PY QA RE RO RS RU RW SA SB SC SD SE SG SH SI SJ SK SL SM SN SO SR SS ST SV '
+    'SX SY SZ TC TD TF TG TH TJ TK TL TM TN TO TR TT TV TW TZ UA UG UM US UY UZ VA VC VE VG VI VN VU WF WS YE '
+    'YT ZA ZM ZW'
+).split()
+
+# Pattern name -> precompiled regex matched against the whole (stripped) value
+PATTERN_LIBRARY: Dict[str, Pattern] = {}
+
+_combined_pattern: Optional[Pattern] = None
+
+def register_pattern(name: str, regex: str, ignore_case: bool = False) -> None:
+    """
+    Add a named pattern to the library used by pattern_match_ratios
+
+    All patterns run together as one combined regex, so registering a
+    pattern does not add another pass over the data. The regex must match
+    the whole value and must not define named groups.
+
+    Args:
+        name (str): Pattern name reported in 'pattern_ratios'
+        regex (str): Regular expression for a full value
+        ignore_case (bool): Match case-insensitively
+    """
+    global _combined_pattern
+    PATTERN_LIBRARY[name] = re.compile(regex, re.IGNORECASE if ignore_case else 0)
+    _combined_pattern = None
+
+def _combined_library() -> Tuple[Pattern, List[str]]:
+    """One regex with an optional lookahead per pattern; each matching pattern sets its group"""
+    global _combined_pattern
+    names = list(PATTERN_LIBRARY)
+    if _combined_pattern is None:
+        parts = []
+        for i, name in enumerate(names):
+            compiled = PATTERN_LIBRARY[name]
+            flags = '?i' if compiled.flags & re.IGNORECASE else '?'
+            parts.append(f"(?:(?=(?P<p{i}>({flags}:{compiled.pattern})$)))?")
+        _combined_pattern = re.compile(''.join(parts))
+    return _combined_pattern, names
+
+register_pattern('email', r'[^@\s]+@[^@\s]+\.[^@\s]+')
+register_pattern('date', r'(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}'
+                         r'|\d{1,2}\s+[A-Za-z]{3,9}\.?,?\s+\d{4}|[A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{4})'
+                         r'(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?')
+register_pattern('phone', r'(?!\d{4}-\d{1,2}-\d{1,2}$)(?=(?:\D*\d){7,15}\D*$)\+?[\d\s().-]+')
+register_pattern('postal_code', r'\d{5}(?:-\d{4})?|\d{6}|[A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2}|[A-Z]\d[A-Z]\s?\d[A-Z]\d',
+                 ignore_case=True)
+register_pattern('uuid', r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', ignore_case=True)
+register_pattern('currency_amount', r'[-+]?(?:[$€£¥₹]\s?|[A-Z]{3}\s)\d{1,3}(?:,?\d{3})*(?:\.\d{1,2})?'
+                                    r'|[-+]?\d{1,3}(?:,?\d{3})*(?:\.\d{1,2})?\s?(?:[$€£¥₹]|[A-Z]{3})')
+register_pattern('country_code', '|'.join(ISO_COUNTRY_CODES))
+
+# Rows checked against the pattern library in approximate profiling mode
+APPROXIMATE_PATTERN_ROWS = 10000
+
+# Rows sketched and pattern-checked at a time in approximate profiling mode
+APPROXIMATE_BLOCK_ROWS = 100000
+
+def _pattern_texts(distinct: Any) -> pd.Series:
+    """Stripped text of each distinct value as the patterns see it: whole floats print as integers, booleans are missing"""
+    values = pd.Series(distinct, dtype=object if _is_text_dtype(getattr(distinct, 'dtype', object)) else None)
+    if pd.api.types.is_float_dtype(values.dtype):
+        numbers = values.to_numpy()
+        with np.errstate(invalid='ignore'):
+            whole = (np.abs(numbers) < 2 ** 63) & (numbers == np.floor(numbers))
+        texts = values.astype(str).astype(object)
+        texts[whole] = values[whole].astype(np.int64).astype(str).astype(object)
+    elif pd.api.types.is_bool_dtype(values.dtype):
+        texts = pd.Series([None] * len(values), dtype=object)
+    elif values.dtype != object:
+        texts = values.astype(str).astype(object)
+    else:
+        texts = values.copy()
+        other = values.map(lambda value: not isinstance(value, str)).astype(bool)
+        if other.any():
+            # Mixed object columns: only the non-string values need converting one by one
+            texts[other] = values[other].map(_pattern_text)
+    return texts.str.strip()
+
+def _pattern_text(value: Any) -> Optional[str]:
+    if isinstance(value, (bool, np.bool_)):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+def _pattern_counts(series: pd.Series, factorized: Optional[Tuple[np.ndarray, Any]] = None) -> Tuple[Dict[str, int], int]:
+    """
+    Rows matching each library pattern, and the number of non-missing rows
+
+    The distinct values (from factorized, or a fresh pd.factorize) go through
+    the combined regex once, with Series.str.extract, and each match is
+    weighted by how often its value occurs.
+    """
+    counts = dict.fromkeys(PATTERN_LIBRARY, 0)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        present = int(series.notna().sum())
+        if 'date' in counts:
+            counts['date'] = present
+        return counts, present
+    if not (_is_text_dtype(series.dtype) or pd.api.types.is_integer_dtype(series.dtype)
+            or pd.api.types.is_float_dtype(series.dtype)):
+        return counts, int(series.notna().sum())
+
+    codes, distinct = pd.factorize(series) if factorized is None else factorized
+    occurrences = np.bincount(codes[codes >= 0], minlength=len(distinct))
+    if len(distinct):
+        combined, names = _combined_library()
+        # Object dtype keeps extract on Python's re, which supports the lookaheads
+        groups = _pattern_texts(distinct).str.extract(combined)
+        for i, name in enumerate(names):
+            counts[name] = int(occurrences[groups[f"p{i}"].notna().to_numpy()].sum())
+    return counts, int(occurrences.sum())
+
+def pattern_match_ratios(series: pd.Series, factorized: Optional[Tuple[np.ndarray, Any]] = None) -> Dict[str, float]:
+    """
+    Share of non-missing values matching each pattern in PATTERN_LIBRARY
+
+    Args:
+        series (Series): Column to check
+        factorized (tuple, optional): (codes, distinct) from pd.factorize(series), to reuse
+    Returns:
+        Dict: Pattern name -> share of non-missing rows matching it
+    """
+    counts, present = _pattern_counts(series, factorized)
+    return {name: (count / present if present else 0.0) for name, count in counts.items()}
+
 def detect_patterns(series: pd.Series) -> Dict:
     """Detect common patterns in data"""
-    patterns = {
-        'has_email': series.str.contains('@').any() if series.dtype == 'object' else False,
-        'all_uppercase': series.str.isupper().all() if series.dtype == 'object' else False,
-        'all_lowercase': series.str.islower().all() if series.dtype == 'object' else False,
-        'numeric_only': series.str.isnumeric().all() if series.dtype == 'object' else False
-    }
-    return patterns
+    _, distinct = pd.factorize(series)
+    return _pattern_flags(distinct, series.dtype)
 
 def suggest_transformation(column_analysis: Dict) -> str:
     """Suggest appropriate transformation based on data patterns"""
@@ -142,24 +2712,398 @@ def suggest_transformation(column_analysis: Dict) -> str:
         return 'direct or uppercase'
     return 'direct'
 
-def reverse_engineer_mapping(input_file: str, target_file: str) -> pd.DataFrame:
+def _is_analysis(data: Any) -> bool:
+    return isinstance(data, dict) and 'columns' in data
+
+# Suggestions kept per target column by reverse_engineer_mapping
+DEFAULT_TOP_K = 3
+
+def _dtype_family(data_type: str) -> str:
+    """Coarse kind of a dtype name, so int/float or object/str columns still block together"""
+    if data_type in ('object', 'category', 'str') or data_type.startswith('string'):
+        return 'text'
+    if pd.api.types.is_bool_dtype(data_type):
+        return 'bool'
+    if data_type.startswith('datetime'):
+        return 'datetime'
+    try:
+        return 'numeric' if pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(data_type)) else data_type
+    except TypeError:
+        return data_type
+
+def _signature_keys(column_info: Dict) -> List[Tuple]:
+    """
+    Blocking keys of a column: two columns can only match if they share a key
+
+    Keys come from the content (pattern flags and MinHash LSH bands), and
+    each carries the dtype family as a filter, so columns of different kinds
+    never share a block and a column without content keys has none.
+    """
+    family = _dtype_family(column_info['data_type'])
+    keys = []
+    for flag in ('has_email', 'numeric_only'):
+        if column_info['patterns'].get(flag):
+            keys.append((flag, family))
+    # LSH bands: columns with overlapping values collide in some band
+    signature = column_info.get('minhash')
+    if signature is not None:
+        for start in range(0, len(signature), MINHASH_BAND_SIZE):
+            keys.append(('minhash_band', family, start, signature[start:start + MINHASH_BAND_SIZE].tobytes()))
+    return keys
+
+def build_column_index(analysis: Dict) -> Dict[Tuple, List[str]]:
+    """
+    Index the columns of an analysis by their blocking keys
+
+    Args:
+        analysis (Dict): Result of analyze_data_structure
+    Returns:
+        Dict: Blocking key -> column names, in analysis order
+    """
+    index = defaultdict(list)
+    for column, column_info in analysis['columns'].items():
+        for key in _signature_keys(column_info):
+            index[key].append(column)
+    return dict(index)
+
+def candidate_columns(index: Dict[Tuple, List[str]], target_info: Dict) -> List[str]:
+    """Source columns sharing at least one blocking key with the target column"""
+    candidates = {}
+    for key in _signature_keys(target_info):
+        for column in index.get(key, ()):
+            candidates[column] = True
+    return list(candidates)
+
+def _sample_overlap(source_info: Dict, target_info: Dict) -> float:
+    """Jaccard overlap of the case-folded sample values, for analyses without MinHash sketches"""
+    source_values = {str(value).casefold() for value in source_info['sample_values']}
+    target_values = {str(value).casefold() for value in target_info['sample_values']}
+    if not source_values or not target_values:
+        return 0.0
+    return len(source_values & target_values) / len(source_values | target_values)
+
+def score_column_match(source_info: Dict, target_info: Dict) -> float:
+    """
+    Score how likely a target column is derived from a source column, between 0 and 1
+
+    Combines dtype equality, agreement of the pattern flags and the estimated
+    overlap of the two columns' values, which carries most of the weight.
+    """
+    flags = set(source_info['patterns']) | set(target_info['patterns'])
+    agreeing = sum(bool(source_info['patterns'].get(flag)) == bool(target_info['patterns'].get(flag)) for flag in flags)
+    pattern_score = agreeing / len(flags) if flags else 0.0
+    dtype_score = 1.0 if source_info['data_type'] == target_info['data_type'] else 0.0
+    if 'minhash' in source_info and 'minhash' in target_info:
+        value_score = estimate_jaccard(source_info['minhash'], target_info['minhash'])
+    else:
+        value_score = _sample_overlap(source_info, target_info)
+    return 0.3 * dtype_score + 0.2 * pattern_score + 0.5 * value_score
+
+# Rows per file used to verify candidate transforms
+VERIFY_SAMPLE_SIZE = 1000
+
+# Share of a target's distinct sampled values that a transformed source column
+# must produce to be verified even when no blocking key matched
+VALUE_HIT_THRESHOLD = 0.5
+
+def _load_sample(data: Union[str, pd.DataFrame, Dict], sample_size: int = VERIFY_SAMPLE_SIZE) -> Optional[pd.DataFrame]:
+    """First sample_size rows of a file or DataFrame; None for an analysis result, which carries no rows"""
+    if _is_analysis(data):
+        return None
+    if isinstance(data, pd.DataFrame):
+        return data.head(sample_size)
+    return next(read_input_chunks(data, sample_size), None)
+
+def _comparable(series: pd.Series) -> np.ndarray:
+    """Values as strings for exact comparison; missing and empty values become None"""
+    if pd.api.types.is_float_dtype(series.dtype) and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64')
+    values = series.to_numpy(dtype=object)
+    text = values.astype(str).astype(object)
+    text[pd.isna(values) | (text == '')] = None
+    return text
+
+def _rule_outputs(source_sample: pd.DataFrame) -> Dict[str, List[Tuple[str, np.ndarray]]]:
+    """Every applicable transform applied once to every sampled source column"""
+    outputs = {}
+    for column in source_sample.columns:
+        outputs[column] = []
+        for name, transform in TRANSFORMS.items():
+            try:
+                outputs[column].append((name, _comparable(transform(source_sample[column]))))
+            except Exception:
+                # Rule does not apply to this column, e.g. a string rule on numbers
+                continue
+    return outputs
+
+def _value_hit_candidates(rule_outputs: Dict[str, List[Tuple[str, np.ndarray]]],
+                          target_values: Dict[str, np.ndarray]) -> Dict[str, List[str]]:
+    """
+    Source columns whose transformed values cover a target column's values
+
+    An inverted index from transformed value to source column lets every
+    target be checked in time linear in its number of distinct values.
+    """
+    postings = defaultdict(set)
+    for column, outputs in rule_outputs.items():
+        for _, values in outputs:
+            for value in set(values):
+                if value is not None:
+                    postings[value].add(column)
+
+    candidates = {}
+    for target, values in target_values.items():
+        distinct = {value for value in values if value is not None}
+        hits = defaultdict(int)
+        for value in distinct:
+            for column in postings.get(value, ()):
+                hits[column] += 1
+        candidates[target] = [column for column in rule_outputs
+                              if distinct and hits[column] >= VALUE_HIT_THRESHOLD * len(distinct)]
+    return candidates
+
+def _best_rule(outputs: List[Tuple[str, np.ndarray]], target: np.ndarray) -> Tuple[Optional[str], float]:
+    """
+    Rule whose output agrees with the target on the most rows; earlier (simpler) rules win ties
+
+    Rows missing on both sides are left out: a rule that yields nothing
+    does not agree with an empty target column.
+    """
+    best_rule, best_confidence = None, 0.0
+    if len(target) == 0:
+        return best_rule, best_confidence
+    target_missing = pd.isna(target)
+    for name, values in outputs:
+        compared = ~(pd.isna(values) & target_missing)
+        if not compared.any():
+            continue
+        confidence = float(np.mean((values == target)[compared]))
+        if confidence > best_confidence:
+            best_rule, best_confidence = name, confidence
+    return best_rule, best_confidence
+
+def _align_samples(source_sample: pd.DataFrame, target_sample: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Pair sampled rows by position"""
+    rows = min(len(source_sample), len(target_sample))
+    return source_sample.iloc[:rows], target_sample.iloc[:rows]
+
+# Share of the target's sampled keys that must be found in the source to accept a join key
+JOIN_KEY_MIN_COVERAGE = 0.5
+
+def _iter_frames(data: Union[str, pd.DataFrame], columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    if isinstance(data, pd.DataFrame):
+        if columns is not None:
+            data = data[list(columns)]
+        for start in range(0, max(len(data), 1), DEFAULT_CHUNK_SIZE):
+            yield data.iloc[start:start + DEFAULT_CHUNK_SIZE]
+    else:
+        yield from read_input_chunks(data, DEFAULT_CHUNK_SIZE, columns=columns)
+
+def _key_candidates(frame: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Columns that could serve as a row key: mostly filled and without repeated values"""
+    keys = {}
+    for column in frame.columns:
+        values = _comparable(frame[column])
+        present = values[pd.notna(values)]
+        if len(present) >= 2 and len(present) >= 0.9 * len(values) and len(set(present)) == len(present):
+            keys[column] = values
+    return keys
+
+def _scan_join_keys(source_data: Union[str, pd.DataFrame], target_sample: pd.DataFrame
+                    ) -> Tuple[Optional[Tuple[str, str]], Dict[Tuple[str, str], Dict[Any, Tuple]], List[str]]:
+    """
+    Stream the source once, probing its key candidates against the target's
+
+    Returns:
+        Tuple: The best (source_field, target_field) pair or None, the first source row
+            found for each target key of every pair, and the source columns
+    """
+    target_keys = {column: {value for value in values if value is not None}
+                   for column, values in _key_candidates(target_sample).items()}
+    if not target_keys:
+        return None, {}, []
+
+    source_columns = None
+    columns = []
+    matches = defaultdict(dict)
+    rows_scanned = 0
+    for chunk in _iter_frames(source_data):
+        if source_columns is None:
+            source_columns = list(_key_candidates(chunk))
+            columns = list(chunk.columns)
+        rows_scanned += len(chunk)
+        for source_column in source_columns:
+            values = _comparable(chunk[source_column])
+            for target_column, keys in target_keys.items():
+                mask = pd.Series(values).isin(keys).to_numpy()
+                if not mask.any():
+                    continue
+                # Keep the matching rows, so aligning on the chosen key needs no second scan
+                found = matches[(source_column, target_column)]
+                for row, value in zip(chunk[mask].itertuples(index=False, name=None), values[mask]):
+                    found.setdefault(value, row)
+        if any(len(found) >= len(target_keys[target]) for (_, target), found in matches.items()):
+            break
+
+    best_pair, best_coverage = None, 0.0
+    for (source_column, target_column), found in matches.items():
+        coverage = len(found) / max(1, min(len(target_keys[target_column]), rows_scanned))
+        if coverage > best_coverage:
+            best_pair, best_coverage = (source_column, target_column), coverage
+    if best_coverage < JOIN_KEY_MIN_COVERAGE:
+        best_pair = None
+    return best_pair, matches, columns
+
+def infer_join_key(source_data: Union[str, pd.DataFrame], target_sample: pd.DataFrame) -> Optional[Tuple[str, str]]:
+    """
+    Infer which source and target columns identify the same rows
+
+    Target columns with unique values are indexed as hash sets; the source is
+    then streamed once and each source column that is unique in the first
+    chunk is probed against them. Scanning stops as soon as one pair has
+    found every sampled target key.
+
+    Args:
+        source_data (str or DataFrame): Source file path or loaded data
+        target_sample (DataFrame): Sampled target rows
+    Returns:
+        Tuple or None: (source_field, target_field), or None when no pair covers enough target keys
+    """
+    return _scan_join_keys(source_data, target_sample)[0]
+
+def align_samples(input_data: Union[str, pd.DataFrame], target_data: Union[str, pd.DataFrame],
+                  sample_size: int = VERIFY_SAMPLE_SIZE) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[Tuple[str, str]]]:
+    """
+    Sample target rows and find the matching input rows
+
+    The input is streamed once: while the join key is inferred (see
+    infer_join_key), the rows whose key appears in the target sample are
+    collected, so shuffled or filtered targets still line up. Without a key,
+    rows are paired by position.
+
+    Args:
+        input_data (str or DataFrame): Input file path or loaded data
+        target_data (str or DataFrame): Target file path or loaded data
+        sample_size (int): Target rows to sample
+    Returns:
+        Tuple: Aligned input rows, aligned target rows and the join key used (None when positional)
+    """
+    target_sample = _load_sample(target_data, sample_size)
+    key, matches, columns = _scan_join_keys(input_data, target_sample)
+    if key is None:
+        source_sample, target_sample = _align_samples(_load_sample(input_data, sample_size), target_sample)
+        return source_sample.reset_index(drop=True), target_sample.reset_index(drop=True), None
+
+    target_positions = {}
+    for position, value in enumerate(_comparable(target_sample[key[1]])):
+        if value is not None:
+            target_positions.setdefault(value, position)
+    matched = sorted(((target_positions[value], row) for value, row in matches[key].items()), key=lambda item: item[0])
+    source_rows = pd.DataFrame.from_records([row for _, row in matched], columns=columns)
+    target_rows = target_sample.iloc[[position for position, _ in matched]].reset_index(drop=True)
+    return source_rows, target_rows, key
+
+def verify_transforms(source_sample: pd.DataFrame, target_sample: pd.DataFrame,
+                      pairs: Optional[List[Tuple[str, str]]] = None) -> pd.DataFrame:
+    """
+    Find the transform that best reproduces each target column from a source column
+
+    Every rule in TRANSFORMS is applied once per source column of the sample,
+    then checked against all candidate target columns at once. Confidence is
+    the share of aligned rows where the transformed value equals the target.
+
+    Args:
+        source_sample (DataFrame): Sampled input rows
+        target_sample (DataFrame): Sampled target rows
+        pairs (list, optional): (source_field, target_field) pairs to check; all pairs when omitted
+    Returns:
+        DataFrame: source_field, target_field, transform_rule and confidence per verified pair
+    """
+    source_sample, target_sample = _align_samples(source_sample, target_sample)
+    rule_outputs = _rule_outputs(source_sample)
+    target_values = {column: _comparable(target_sample[column]) for column in target_sample.columns}
+    if pairs is None:
+        pairs = [(source, target) for target in target_values for source in rule_outputs]
+    results = []
+    for source, target in pairs:
+        rule, confidence = _best_rule(rule_outputs[source], target_values[target])
+        if rule is not None:
+            results.append({'source_field': source, 'target_field': target,
+                            'transform_rule': rule, 'confidence': round(confidence, 4)})
+    return pd.DataFrame(results, columns=['source_field', 'target_field', 'transform_rule', 'confidence'])
+
+def reverse_engineer_mapping(input_file: Union[str, pd.DataFrame, Dict], target_file: Union[str, pd.DataFrame, Dict],
+                             cache_dir: Optional[str] = None, top_k: Optional[int] = DEFAULT_TOP_K,
+                             verify: bool = True) -> pd.DataFrame:
     """
     Reverse engineer mapping rules by comparing input and target data structures
+
+    Each target column is only compared with the source columns sharing a
+    blocking key (pattern flag or value sketch band, within the same dtype
+    family) with it; a target without any such source is compared with every
+    source of its dtype family instead. When rows
+    are available, target rows are sampled and matched to input rows through
+    an inferred join key (see align_samples), and every transform is tried on
+    them: sources whose transformed values cover the target join the
+    candidates, and the rule with the best agreement is reported with its
+    confidence. The join key used is stored in the result's attrs['join_key'].
+
+    Args:
+        input_file (str, DataFrame or dict): Input file path, loaded data or a result of analyze_data_structure
+        target_file (str, DataFrame or dict): Target file path, loaded data or a result of analyze_data_structure
+        cache_dir (str, optional): Analysis cache directory, see analyze_data_structure
+        top_k (int, optional): Suggestions kept per target column; None keeps every candidate
+        verify (bool): Verify transforms on sampled rows (needs files or DataFrames, not analysis results)
+    Returns:
+        DataFrame: Suggested source_field, target_field, transform_rule, score and confidence rows;
+            transform_rule is always a valid rule, or empty when none could be verified
     """
-    input_analysis = analyze_data_structure(input_file)
-    target_analysis = analyze_data_structure(target_file)
+    input_analysis = input_file if _is_analysis(input_file) else analyze_data_structure(input_file, cache_dir=cache_dir)
+    target_analysis = target_file if _is_analysis(target_file) else analyze_data_structure(target_file, cache_dir=cache_dir)
+    source_index = build_column_index(input_analysis)
+    source_families = defaultdict(list)
+    for column, column_info in input_analysis['columns'].items():
+        source_families[_dtype_family(column_info['data_type'])].append(column)
+
+    rule_outputs, target_values, value_hits, join_key = None, {}, {}, None
+    if verify and not _is_analysis(input_file) and not _is_analysis(target_file):
+        input_sample, target_sample, join_key = align_samples(input_file, target_file)
+        rule_outputs = _rule_outputs(input_sample)
+        target_values = {column: _comparable(target_sample[column]) for column in target_sample.columns}
+        value_hits = _value_hit_candidates(rule_outputs, target_values)
     
     suggested_mappings = []
     for target_col, target_info in target_analysis['columns'].items():
-        for source_col, source_info in input_analysis['columns'].items():
-            if similar_patterns(source_info, target_info):
-                suggested_mappings.append({
-                    'source_field': source_col,
-                    'target_field': target_col,
-                    'transform_rule': suggest_transformation(source_info)
-                })
+        candidates = candidate_columns(source_index, target_info)
+        candidates += [column for column in value_hits.get(target_col, ()) if column not in candidates]
+        if not candidates:
+            # Derived values (initials, short names) share no block with their source
+            candidates = list(source_families.get(_dtype_family(target_info['data_type']), ()))
+        scored = []
+        for source_col in candidates:
+            source_info = input_analysis['columns'][source_col]
+            # Unverified pattern hints ("direct or lowercase") are not rules
+            hint, confidence = suggest_transformation(source_info), None
+            rule = hint if is_named_rule(hint) else ''
+            if rule_outputs is not None and source_col in rule_outputs and target_col in target_values:
+                verified_rule, confidence = _best_rule(rule_outputs[source_col], target_values[target_col])
+                rule = verified_rule or rule
+            scored.append((confidence or 0.0, score_column_match(source_info, target_info), source_col, rule, confidence))
+        # Verified agreement ranks first; the stable sort keeps source column order among ties
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        for _, score, source_col, rule, confidence in scored[:top_k]:
+            suggested_mappings.append({
+                'source_field': source_col,
+                'target_field': target_col,
+                'transform_rule': rule,
+                'score': round(score, 4),
+                'confidence': None if confidence is None else round(confidence, 4)
+            })
     
-    return pd.DataFrame(suggested_mappings)
+    suggestions = pd.DataFrame(suggested_mappings,
+                               columns=['source_field', 'target_field', 'transform_rule', 'score', 'confidence'])
+    suggestions.attrs['join_key'] = join_key
+    return suggestions
 
 def similar_patterns(source_info: Dict, target_info: Dict) -> bool:
     """Check if two columns have similar patterns"""
@@ -170,6 +3114,10 @@ def similar_patterns(source_info: Dict, target_info: Dict) -> bool:
     )
 
 if __name__ == "__main__":    
+    # Batch mode: python data_mapper.py <inputs> <mapping_file> <output_dir> [options]
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
     # Use relative paths to avoid path issues
     base_dir = os.path.dirname(os.path.abspath(__file__))
     input_file = "C:\\Users\\kchhatbar\\OneDrive - Deloitte (O365D)\\Documents\\AMEX\\copilot\\data_mapping\\sample_input.xlsx"
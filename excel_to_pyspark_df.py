@@ -1,5 +1,17 @@
+import atexit
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
 import pandas as pd
 
+from data_mapper import (TRANSFORM_FACTORIES, TRANSFORMS, BinaryOp, Column, Literal, MappingPlan, MappingRule,
+                         UnaryOp, _widen_schema, arrow_schema, arrow_table, compile_mapping_plan,
+                         file_content_hash, fill_schema, input_format, read_excel_chunks, update_type_sample)
+
 def excel_to_pandas_df(excel_file, sheet_name=0):
     """
     Reads an Excel file into a Pandas DataFrame.
@@ -19,6 +31,349 @@ def excel_to_pandas_df(excel_file, sheet_name=0):
         print(f"Error: {e}")
         return None
 
+# Rows per Parquet part file, and so per Spark partition, when converting a workbook
+DEFAULT_ROWS_PER_PARTITION = 100000
+
+# Marker written once a conversion is complete, as Spark does for its own output
+CONVERSION_DONE_MARKER = "_SUCCESS"
+
+# Conversions made without an explicit cache_dir live here until the interpreter exits
+_session_cache_dir = None
+
+def convert_excel_to_parquet(excel_file, output_dir, sheet_name=0, rows_per_partition=DEFAULT_ROWS_PER_PARTITION):
+    """
+    Converts an Excel sheet into Parquet part files, one per row range.
+
+    The sheet is streamed one range at a time. Columns without values so far
+    are stored as strings; when a later range brings their first values (or
+    does not fit a column's type), the part files written so far are rewritten
+    one by one with the new schema. The files are written to a new directory
+    next to output_dir, which is renamed into place once complete.
+
+    Parameters:
+        excel_file (str): Path to the Excel file.
+        output_dir (str): Directory for part-NNNNN.parquet files; must not exist yet.
+        sheet_name (str or int): Sheet name or index to read. Default is the first sheet.
+        rows_per_partition (int): Rows per part file.
+
+    Returns:
+        list: Paths of the part files, in row order.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if os.path.exists(output_dir):
+        raise FileExistsError(f"Output directory already exists: {output_dir}")
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".converting_", dir=parent)
+    try:
+        schema = None
+        sample = None
+        names = []
+        for chunk in read_excel_chunks(excel_file, rows_per_partition, sheet_name):
+            sample, filled = update_type_sample(chunk, sample)
+            if schema is None:
+                schema = _null_as_string(arrow_schema([sample]))
+            elif filled:
+                typed = _null_as_string(fill_schema(schema, sample, filled))
+                if not typed.equals(schema):
+                    schema = typed
+                    _retype_parts(staging_dir, names, schema)
+            try:
+                table = arrow_table(chunk, schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                schema = _null_as_string(_widen_schema(schema, arrow_schema([chunk])))
+                _retype_parts(staging_dir, names, schema)
+                table = arrow_table(chunk, schema)
+            name = f"part-{len(names):05d}.parquet"
+            pq.write_table(table, os.path.join(staging_dir, name))
+            names.append(name)
+        open(os.path.join(staging_dir, CONVERSION_DONE_MARKER), "w").close()
+        os.rename(staging_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return [os.path.join(output_dir, name) for name in names]
+
+def _null_as_string(schema):
+    import pyarrow as pa
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                      for field in schema], metadata=schema.metadata)
+
+def _retype_parts(directory, names, schema):
+    """Rewrites the part files written so far with a new schema, one file at a time."""
+    import pyarrow.parquet as pq
+    for name in names:
+        path = os.path.join(directory, name)
+        pq.write_table(pq.read_table(path).cast(schema), path)
+
+def _excel_parquet_dir(excel_file, sheet_name, rows_per_partition, cache_dir):
+    # Keyed by content, so an edited workbook is converted again
+    prefix = _excel_cache_prefix(excel_file, sheet_name, rows_per_partition)
+    return os.path.join(cache_dir, prefix + file_content_hash(excel_file)[:16])
+
+def _excel_cache_prefix(excel_file, sheet_name, rows_per_partition):
+    # Workbooks with the same name in different folders can share a cache_dir
+    name = os.path.splitext(os.path.basename(excel_file))[0]
+    location = hashlib.sha1(os.path.abspath(excel_file).encode("utf-8")).hexdigest()[:8]
+    return f"{name}_{location}_{sheet_name}_{rows_per_partition}_"
+
+def _remove_stale_conversions(cache_dir, excel_file, sheet_name, rows_per_partition, keep):
+    """Deletes earlier conversions of the same workbook path and sheet, left behind when the workbook changed."""
+    prefix = _excel_cache_prefix(excel_file, sheet_name, rows_per_partition)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and path != keep and os.path.exists(os.path.join(path, CONVERSION_DONE_MARKER)):
+            shutil.rmtree(path, ignore_errors=True)
+
+def _default_cache_dir():
+    global _session_cache_dir
+    if _session_cache_dir is None:
+        _session_cache_dir = tempfile.mkdtemp(prefix="excel_to_spark_")
+        atexit.register(shutil.rmtree, _session_cache_dir, True)
+    return _session_cache_dir
+
+def excel_to_spark_df(excel_file, spark=None, sheet_name=0, rows_per_partition=DEFAULT_ROWS_PER_PARTITION,
+                      cache_dir=None):
+    """
+    Reads an Excel file into a Spark DataFrame without collecting it in the driver.
+
+    The sheet is converted once into Parquet part files of rows_per_partition
+    rows, each read as one Spark partition; later calls reuse the conversion
+    until the workbook changes, and the outdated conversion is then removed.
+
+    Parameters:
+        excel_file (str): Path to the Excel file.
+        spark (pyspark.sql.SparkSession): Session to use. Default starts a local[*] session.
+        sheet_name (str or int): Sheet name or index to read. Default is the first sheet.
+        rows_per_partition (int): Rows per row range and Spark partition.
+        cache_dir (str): Where converted Parquet files are kept across runs. Default is a
+            temporary directory removed when the Python process exits.
+
+    Returns:
+        pyspark.sql.DataFrame: Spark DataFrame containing the Excel data.
+    """
+    spark = spark or get_spark_session()
+    cache_dir = cache_dir or _default_cache_dir()
+    parquet_dir = _excel_parquet_dir(excel_file, sheet_name, rows_per_partition, cache_dir)
+    if not os.path.exists(os.path.join(parquet_dir, CONVERSION_DONE_MARKER)):
+        convert_excel_to_parquet(excel_file, parquet_dir, sheet_name, rows_per_partition)
+        _remove_stale_conversions(cache_dir, excel_file, sheet_name, rows_per_partition, keep=parquet_dir)
+    # One scan per part file; a single scan of the directory would pack small files together
+    parts = sorted(name for name in os.listdir(parquet_dir) if name.endswith(".parquet"))
+    scans = [spark.read.parquet(os.path.join(parquet_dir, name)) for name in parts]
+    return functools.reduce(lambda left, right: left.unionByName(right), scans)
+
+def benchmark_spark_loaders(excel_file, spark=None, rows_per_partition=DEFAULT_ROWS_PER_PARTITION):
+    """
+    Times the Spark loader against the pandas round-trip in the current session.
+
+    Each loader is timed up to a count() of the loaded DataFrame.
+
+    Parameters:
+        excel_file (str): Path to the Excel file.
+        spark (pyspark.sql.SparkSession): Session to use. Default starts a local[*] session.
+        rows_per_partition (int): Rows per row range and Spark partition.
+
+    Returns:
+        pandas.DataFrame: One row per loader with method, seconds, partitions and rows.
+    """
+    spark = spark or get_spark_session()
+    cache_dir = tempfile.mkdtemp(prefix="excel_to_spark_benchmark_")
+    load_parquet = functools.partial(excel_to_spark_df, excel_file, spark, rows_per_partition=rows_per_partition,
+                                     cache_dir=cache_dir)
+    loaders = [
+        ("pandas_round_trip", lambda: spark.createDataFrame(excel_to_pandas_df(excel_file))),
+        ("parquet_first_run", load_parquet),
+        ("parquet_cached", load_parquet),
+    ]
+    results = []
+    try:
+        for method, load in loaders:
+            start = time.perf_counter()
+            spark_df = load()
+            rows = spark_df.count()
+            results.append({"method": method, "seconds": time.perf_counter() - start,
+                            "partitions": spark_df.rdd.getNumPartitions(), "rows": rows})
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return pd.DataFrame(results, columns=["method", "seconds", "partitions", "rows"])
+
+def get_spark_session(app_name="data_mapping", master="local[*]"):
+    """
+    Returns a SparkSession, starting one if needed.
+
+    Parameters:
+        app_name (str): Spark application name.
+        master (str): Spark master URL. Default runs locally on all cores.
+
+    Returns:
+        pyspark.sql.SparkSession: The active session.
+    """
+    from pyspark.sql import SparkSession
+    return SparkSession.builder.appName(app_name).master(master).getOrCreate()
+
+# Mapping rules run as native Spark columns through the transforms' spark_kernel
+# (see data_mapper.Transform), so the whole mapping stays in the JVM. Transforms
+# registered without one run their pandas implementation batch-wise in a pandas UDF.
+
+def _spark_trim(column):
+    from pyspark.sql import functions as F
+    return F.regexp_replace(column.cast("string"), r"^\s+|\s+$", "")
+
+def _spark_length(column):
+    from pyspark.sql import functions as F
+    return F.length(column.cast("string"))
+
+def _spark_pandas_batch(series, transform):
+    result = transform(series)
+    # The UDF returns strings; other results (e.g. numbers from an 'object' transform) are sent as text
+    present = result.notna()
+    text = result.astype(object).where(present, None)
+    text[present] = result[present].astype(str)
+    return text
+
+def _spark_transform(transform, column, data_type=None):
+    """Applies a Transform to a Spark column: its spark_kernel, or the pandas implementation in a UDF."""
+    if transform.spark_kernel is not None:
+        return transform.spark_kernel(column)
+    from pyspark.sql import functions as F
+    from pyspark.sql.types import StringType
+    if transform.output_dtype == "same" and data_type is not None:
+        return F.pandas_udf(transform, data_type)(column)
+    return F.pandas_udf(functools.partial(_spark_pandas_batch, transform=transform), StringType())(column)
+
+def _spark_condition(column):
+    from pyspark.sql import functions as F
+    return F.coalesce(column, F.lit(False))
+
+def _spark_literal(node, function):
+    if not isinstance(node, Literal):
+        raise ValueError(f"Spark mapping needs literal arguments after the first in {function}()")
+    return node.value
+
+def _spark_expression(node):
+    """Translates a mapping expression AST into a Spark Column."""
+    from pyspark.sql import functions as F
+    if isinstance(node, Column):
+        return F.col(node.name)
+    if isinstance(node, Literal):
+        return F.lit(node.value)
+    if isinstance(node, UnaryOp):
+        operand = _spark_expression(node.operand)
+        return ~_spark_condition(operand) if node.operator == "not" else -operand
+    if isinstance(node, BinaryOp):
+        left, right = _spark_expression(node.left), _spark_expression(node.right)
+        if node.operator == "||":
+            return F.concat(left.cast("string"), right.cast("string"))
+        if node.operator == "and":
+            return _spark_condition(left) & _spark_condition(right)
+        if node.operator == "or":
+            return _spark_condition(left) | _spark_condition(right)
+        operators = {"+": "__add__", "-": "__sub__", "*": "__mul__", "/": "__truediv__",
+                     "<": "__lt__", "<=": "__le__", ">": "__gt__", ">=": "__ge__",
+                     "=": "__eq__", "==": "__eq__", "!=": "__ne__", "<>": "__ne__"}
+        return getattr(left, operators[node.operator])(right)
+
+    arguments = [_spark_expression(argument) for argument in node.arguments]
+    if node.function == "if":
+        return F.when(_spark_condition(arguments[0]), arguments[1]).otherwise(arguments[2])
+    if node.function == "coalesce":
+        return F.coalesce(*arguments)
+    if node.function == "upper":
+        return _spark_transform(TRANSFORMS["uppercase"], arguments[0])
+    if node.function == "lower":
+        return _spark_transform(TRANSFORMS["lowercase"], arguments[0])
+    if node.function == "trim":
+        return _spark_trim(arguments[0])
+    if node.function == "length":
+        return _spark_length(arguments[0])
+    if node.function in ("substr", "split"):
+        literals = [_spark_literal(argument, node.function) for argument in node.arguments[1:]]
+        transform = TRANSFORM_FACTORIES[node.function].build(literals)
+        return _spark_transform(transform, arguments[0].cast("string"))
+    return _spark_transform(TRANSFORMS[node.function], arguments[0])
+
+def spark_rule_column(rule: MappingRule, schema=None):
+    """
+    Compiles one mapping rule into a native Spark column expression.
+
+    Parameters:
+        rule (MappingRule): Rule from a compiled mapping plan.
+        schema (pyspark.sql.types.StructType): Input schema, giving the result type of
+            'same'-dtype transforms that have no spark_kernel.
+
+    Returns:
+        pyspark.sql.Column: The target column, aliased to the rule's target field.
+    """
+    from pyspark.sql import functions as F
+    if rule.expression is not None:
+        column = _spark_expression(rule.expression)
+    else:
+        data_type = schema[rule.source_field].dataType if schema is not None else None
+        column = _spark_transform(rule.transform, F.col(rule.source_field), data_type)
+    return column.alias(rule.target_field)
+
+def map_spark_df(spark_df, mapping_file):
+    """
+    Applies mapping rules to a Spark DataFrame as a single select.
+
+    Parameters:
+        spark_df (pyspark.sql.DataFrame): Input data containing the source fields.
+        mapping_file (str or MappingPlan): Mapping configuration Excel file or a compiled plan.
+
+    Returns:
+        pyspark.sql.DataFrame: Lazily evaluated target columns in mapping sheet order.
+    """
+    plan = mapping_file if isinstance(mapping_file, MappingPlan) else compile_mapping_plan(mapping_file)
+    plan.validate_input(spark_df.columns)
+    return spark_df.select([spark_rule_column(rule, spark_df.schema) for rule in plan.rules])
+
+def read_spark_input(spark, input_file):
+    """
+    Reads an input file into a Spark DataFrame.
+
+    Parameters:
+        spark (pyspark.sql.SparkSession): Active session.
+        input_file (str): Parquet, CSV or Excel file.
+
+    Returns:
+        pyspark.sql.DataFrame: Input data.
+    """
+    file_type = input_format(input_file)
+    if file_type == "parquet":
+        return spark.read.parquet(input_file)
+    if file_type == "csv":
+        return spark.read.csv(input_file, header=True, inferSchema=True)
+    if file_type == "excel":
+        return excel_to_spark_df(input_file, spark)
+    raise ValueError(f"Unsupported input format for Spark: {input_file}")
+
+def spark_data_mapping(input_file, mapping_file, output_path, spark=None, output_format="parquet"):
+    """
+    Maps an input file with Spark and writes the result.
+
+    Parameters:
+        input_file (str): Parquet, CSV or Excel input.
+        mapping_file (str or MappingPlan): Mapping configuration Excel file or a compiled plan.
+        output_path (str): Output directory, one part file per partition.
+        spark (pyspark.sql.SparkSession): Session to use. Default starts a local[*] session.
+        output_format (str): "parquet" or "csv".
+    """
+    spark = spark or get_spark_session()
+    try:
+        mapped_df = map_spark_df(read_spark_input(spark, input_file), mapping_file)
+        writer = mapped_df.write.mode("overwrite")
+        if output_format == "csv":
+            writer.option("header", True).csv(output_path)
+        else:
+            writer.parquet(output_path)
+        print(f"Spark data mapping completed successfully. Output saved to: {output_path}")
+    except Exception as e:
+        print(f"Error occurred during Spark data mapping: {e}")
+        raise
+
 # Example usage
 if __name__ == "__main__":
     excel_file_path1 = "C:\\Users\\kchhatbar\\OneDrive - Deloitte (O365D)\\Documents\\AMEX\\copilot\\data_mapping\\mapped_output.xlsx"
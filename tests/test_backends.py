@@ -0,0 +1,115 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+pytest.importorskip('polars')
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INPUT = os.path.join(REPO_DIR, 'sample_input.xlsx')
+MAPPING_RULES = os.path.join(REPO_DIR, 'mapping_rules.xlsx')
+
+EDGE_INPUT = pd.DataFrame({
+    'first_name': ['John', '', 'ßara', None, 'Émile', 'x'],
+    'last_name': ['Doe', 'Smith', None, 'O@B', 'a@b@c', 'Lee'],
+    'age': [29, 45, None, 30, 12.5, 80],
+    'email': ['j@x.com', 'bad', '', None, '@y', 'a@b@c'],
+})
+
+EDGE_RULES = pd.DataFrame([
+    ('first_name', 'A', 'uppercase'),
+    ('first_name', 'B', 'lowercase'),
+    ('first_name', 'C', 'first_three_chars'),
+    ('email', 'D', 'extract_domain'),
+    ('age', 'E', 'age_category'),
+    ('email', 'F', 'before_at'),
+    ('first_name', 'G', 'first_letter'),
+    ('age', 'H', 'direct'),
+    ('email', 'J', 'substr(1,2)'),
+    ('email', 'K', "split('@',-1)"),
+    (None, 'L', 'bin(age; 20,40,60; a,b,c,d)'),
+    (None, 'M', "upper(first_name) || ' ' || last_name"),
+    (None, 'N', "if(age < 30, 'Young', 'Other')"),
+    (None, 'O', "if(age >= 30 and not age > 45, 'Mid', null)"),
+    (None, 'P', "coalesce(last_name, email, 'none')"),
+    (None, 'Q', 'age * 2 + 1'),
+    (None, 'R', 'substr(email, 0, 2) || age'),
+    (None, 'T', 'length(trim(first_name))'),
+    (None, 'U', 'age / 4 - -1'),
+    (None, 'V', "first_name = 'John' or age > 50"),
+    (None, 'W', "split(email,'@',1)"),
+], columns=['source_field', 'target_field', 'transform_rule'])
+
+
+def _map_both(input_file, mapping, tmp_path, chunk_size=None):
+    outputs = {}
+    for backend in dm.BACKENDS:
+        output_file = str(tmp_path / f'{backend}.parquet')
+        dm.perform_data_mapping(input_file, mapping, output_file, chunk_size=chunk_size, backend=backend)
+        outputs[backend] = output_file
+    return outputs['pandas'], outputs['polars']
+
+
+def _assert_same_output(pandas_file, polars_file):
+    assert pq.read_schema(pandas_file).remove_metadata() == pq.read_schema(polars_file).remove_metadata()
+    pd.testing.assert_frame_equal(pd.read_parquet(pandas_file), pd.read_parquet(polars_file))
+
+
+@pytest.fixture
+def edge_plan():
+    return dm.compile_mapping_plan(EDGE_RULES)
+
+
+@pytest.fixture(params=['parquet', 'feather', 'csv', 'csv.gz', 'xlsx'])
+def edge_input(request, tmp_path):
+    input_file = str(tmp_path / f'input.{request.param}')
+    dm.write_output(EDGE_INPUT, input_file)
+    return input_file
+
+
+def test_sample_fixture_matches(tmp_path):
+    _assert_same_output(*_map_both(SAMPLE_INPUT, MAPPING_RULES, tmp_path))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5])
+def test_sample_fixture_matches_in_chunks(tmp_path, chunk_size):
+    _assert_same_output(*_map_both(SAMPLE_INPUT, MAPPING_RULES, tmp_path, chunk_size=chunk_size))
+
+
+def test_compare_backends_reports_no_mismatches(edge_input, edge_plan):
+    report = dm.compare_backends(edge_input, edge_plan)
+    assert list(report['target_field']) == edge_plan.target_fields
+    assert (report['mismatches'] == 0).all(), report[report['mismatches'] > 0]
+    assert (report['reference_dtype'] == report['backend_dtype']).all(), report
+
+
+def test_edge_outputs_match(edge_input, edge_plan):
+    reference = edge_plan.apply(dm.read_input(edge_input, columns=edge_plan.source_fields))
+    polars_output = dm._map_polars(edge_input, edge_plan)
+    pd.testing.assert_frame_equal(reference, polars_output)
+
+
+def test_edge_chunked_outputs_match(edge_input, edge_plan, tmp_path):
+    _assert_same_output(*_map_both(edge_input, edge_plan, tmp_path, chunk_size=2))
+
+
+
+def test_text_rules_on_numeric_columns(tmp_path):
+    input_file = str(tmp_path / 'numbers.parquet')
+    dm.write_output(pd.DataFrame({'code': [12345, 678, 9], 'score': [1.5, None, 20.0]}), input_file)
+    rules = pd.DataFrame([(column, f'{rule}_{column}', rule)
+                          for column in ('code', 'score')
+                          for rule in ('uppercase', 'first_three_chars', 'extract_domain', 'before_at', 'first_letter')],
+                         columns=['source_field', 'target_field', 'transform_rule'])
+    plan = dm.compile_mapping_plan(rules)
+    reference = plan.apply(dm.read_input(input_file))
+    assert reference['first_three_chars_code'].tolist() == ['123', '678', '9']
+    assert reference['first_letter_code'].tolist() == ['1', '6', '9']
+    pd.testing.assert_frame_equal(reference, dm._map_polars(input_file, plan))
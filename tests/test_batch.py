@@ -0,0 +1,73 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INPUT = os.path.join(REPO_DIR, 'sample_input.xlsx')
+MAPPING_RULES = os.path.join(REPO_DIR, 'mapping_rules.xlsx')
+
+
+@pytest.fixture
+def batch_inputs(tmp_path):
+    input_dir = tmp_path / 'inputs'
+    input_dir.mkdir()
+    shutil.copy(SAMPLE_INPUT, input_dir / 'north.xlsx')
+    shutil.copy(SAMPLE_INPUT, input_dir / 'south.xlsx')
+    # Missing the age and email columns the mapping needs
+    pd.DataFrame({'first_name': ['Ann']}).to_excel(input_dir / 'broken.xlsx', index=False)
+    # Excel lock files and unsupported files are not inputs
+    (input_dir / '~$north.xlsx').write_bytes(b'')
+    (input_dir / 'notes.txt').write_text('not an input')
+    return input_dir
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_failing_file_does_not_stop_batch(batch_inputs, tmp_path, max_workers):
+    output_dir = tmp_path / 'outputs'
+    summary = dm.batch_data_mapping(str(batch_inputs), MAPPING_RULES, str(output_dir),
+                                    output_ext='.parquet', max_workers=max_workers)
+
+    assert [os.path.basename(path) for path in summary['input_file']] == ['broken.xlsx', 'north.xlsx', 'south.xlsx']
+    assert summary['status'].tolist() == ['failed', 'success', 'success']
+    assert 'age' in summary['error'].iloc[0]
+    assert summary['error'].iloc[1:].isna().all()
+
+    dm.perform_data_mapping(SAMPLE_INPUT, MAPPING_RULES, str(tmp_path / 'expected.parquet'))
+    for name in ('north', 'south'):
+        pd.testing.assert_frame_equal(pd.read_parquet(output_dir / f'{name}.parquet'),
+                                      pd.read_parquet(tmp_path / 'expected.parquet'))
+    assert not (output_dir / 'broken.parquet').exists()
+
+
+def test_duplicate_outputs_are_rejected(tmp_path):
+    input_file = tmp_path / 'region.xlsx'
+    shutil.copy(SAMPLE_INPUT, input_file)
+    dm.write_output(pd.read_excel(SAMPLE_INPUT), str(tmp_path / 'region.csv.gz'))
+
+    with pytest.raises(ValueError, match='same output file'):
+        dm.batch_data_mapping([str(input_file), str(tmp_path / 'region.csv.gz')], MAPPING_RULES,
+                              str(tmp_path / 'outputs'), output_ext='.parquet', max_workers=1)
+    assert not os.listdir(tmp_path / 'outputs')
+
+
+def test_unsupported_output_extension_fails_fast(batch_inputs, tmp_path):
+    with pytest.raises(ValueError):
+        dm.batch_data_mapping(str(batch_inputs), MAPPING_RULES, str(tmp_path / 'outputs'), output_ext='.json')
+    assert not (tmp_path / 'outputs').exists()
+
+
+def test_main_exit_code(batch_inputs, tmp_path):
+    output_dir = str(tmp_path / 'outputs')
+    assert dm.main([str(batch_inputs / '*.xlsx'), MAPPING_RULES, output_dir, '--output-ext', '.csv', '-j', '1']) == 1
+
+    good_inputs = str(batch_inputs / '[ns]*.xlsx')
+    assert dm.main([good_inputs, MAPPING_RULES, output_dir, '--output-ext', '.csv', '-j', '1',
+                    '--chunk-size', '5']) == 0
+    assert sorted(os.listdir(output_dir)) == ['north.csv', 'south.csv']
@@ -0,0 +1,101 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INPUT = os.path.join(REPO_DIR, 'sample_input.xlsx')
+MAPPING_RULES = os.path.join(REPO_DIR, 'mapping_rules.xlsx')
+MAPPED_OUTPUT = os.path.join(REPO_DIR, 'mapped_output.xlsx')
+
+
+def _sheet_columns(excel_file):
+    """Header -> cell values (with their Python types) of the first sheet"""
+    rows = list(load_workbook(excel_file, read_only=True).active.values)
+    return {header: [row[index] for row in rows[1:]] for index, header in enumerate(rows[0])}
+
+
+@pytest.mark.parametrize('chunk_size', [None, 3])
+@pytest.mark.parametrize('use_arrow_kernels', [True, False])
+def test_sample_fixture_cells_are_unchanged(tmp_path, monkeypatch, chunk_size, use_arrow_kernels):
+    monkeypatch.setattr(dm, 'USE_ARROW_KERNELS', use_arrow_kernels)
+    output_file = str(tmp_path / 'mapped.xlsx')
+    dm.perform_data_mapping(SAMPLE_INPUT, MAPPING_RULES, output_file, chunk_size=chunk_size)
+    expected = _sheet_columns(MAPPED_OUTPUT)
+    output = _sheet_columns(output_file)
+    for target_field in pd.read_excel(MAPPING_RULES)['target_field']:
+        assert output[target_field] == expected[target_field], target_field
+
+
+def test_missing_emails_and_ages_stay_missing():
+    frame = pd.DataFrame({'email': ['a@b.com', None, 'plain', float('nan')], 'age': [29, None, 45, float('nan')]})
+    domains = dm.TRANSFORMS['extract_domain'](frame['email'])
+    assert domains.iloc[[0, 2]].tolist() == ['b.com', '']
+    assert domains.iloc[[1, 3]].isna().all()
+    categories = dm.TRANSFORMS['age_category'](frame['age'])
+    assert categories.iloc[[0, 2]].tolist() == ['Young', 'Senior']
+    assert categories.iloc[[1, 3]].isna().all()
+
+
+@pytest.mark.parametrize('dtype', [object, 'str', pd.StringDtype('python')])
+def test_arrow_kernels_match_pandas(monkeypatch, dtype):
+    series = pd.Series(['a@b', '', '@', 'a@b@c', None, 'noat', 'x@', 'ßara', 'Émile'], dtype=dtype)
+    for name, transform in dm.TRANSFORMS.items():
+        if transform.arrow_kernel is None:
+            continue
+        monkeypatch.setattr(dm, 'USE_ARROW_KERNELS', True)
+        result = transform(series)
+        monkeypatch.setattr(dm, 'USE_ARROW_KERNELS', False)
+        pd.testing.assert_series_equal(result, transform(series), obj=name)
+
+
+def test_arrow_kernels_on_chunked_string_columns(monkeypatch):
+    monkeypatch.setattr(dm, 'USE_ARROW_KERNELS', True)
+    # Concatenated str columns are backed by a chunked Arrow array
+    part = pd.Series(['a@b', None, 'x@y@z', 'noat'], dtype='str')
+    series = pd.concat([part, part], ignore_index=True)
+    for name, transform in dm.TRANSFORMS.items():
+        if transform.arrow_kernel is None:
+            continue
+        expected = pd.concat([transform(part), transform(part)], ignore_index=True)
+        pd.testing.assert_series_equal(transform(series), expected, obj=name)
+
+
+@pytest.fixture
+def large_input():
+    data = pd.read_excel(SAMPLE_INPUT)
+    return pd.concat([data] * 50, ignore_index=True)
+
+
+@pytest.mark.parametrize('parallel', ['rules', 'rows'])
+def test_parallel_modes_match_sequential(monkeypatch, large_input, parallel):
+    # Small partitions so 'rows' really splits the 600 rows across workers
+    monkeypatch.setattr(dm, 'MIN_PARTITION_ROWS', 100)
+    plan = dm.compile_mapping_plan(MAPPING_RULES)
+    expected = plan.apply(large_input)
+    output = plan.apply(large_input, parallel=parallel, max_workers=3)
+    assert list(output.columns) == plan.target_fields
+    pd.testing.assert_frame_equal(output, expected)
+
+
+@pytest.mark.parametrize('parallel', ['rules', 'rows'])
+def test_parallel_chunked_mapping_keeps_row_order(tmp_path, large_input, parallel):
+    input_file = str(tmp_path / 'input.csv')
+    large_input.to_csv(input_file, index=False)
+    expected_file = str(tmp_path / 'expected.csv')
+    dm.perform_data_mapping(input_file, MAPPING_RULES, expected_file)
+    output_file = str(tmp_path / 'output.csv')
+    dm.perform_data_mapping(input_file, MAPPING_RULES, output_file, chunk_size=70, parallel=parallel, max_workers=2)
+    pd.testing.assert_frame_equal(pd.read_csv(output_file), pd.read_csv(expected_file))
+
+
+def test_unknown_parallel_mode_is_rejected(large_input):
+    plan = dm.compile_mapping_plan(MAPPING_RULES)
+    with pytest.raises(ValueError, match='parallel mode'):
+        plan.apply(large_input, parallel='columns')
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+
+@pytest.mark.parametrize('values', [
+    ['ALPHA', 'BETA', None, 'GAMMA@X.ORG'] * 50,
+    ['123', '456', '789'] * 50,
+    ['abc', 'Def', 12] * 50,
+    [None] * 10,
+    list(range(300)),
+])
+def test_approximate_profile_matches_exact_flags(monkeypatch, values):
+    monkeypatch.setattr(dm, 'APPROXIMATE_BLOCK_ROWS', 7)
+    series = pd.Series(values, dtype=object)
+    exact = dm.profile_column(series)
+    approximate = dm.profile_column(series, approximate=True)
+    assert approximate['patterns'] == exact['patterns']
+    low, high = approximate['error_bounds']['unique_values']
+    assert low <= exact['unique_values'] <= high
+    assert dm.estimate_jaccard(approximate['minhash'], exact['minhash']) == (1.0 if exact['minhash'] is not None else 0.0)
+
+
+def test_approximate_profile_estimates_large_columns():
+    series = pd.Series(np.arange(200000) % 50000)
+    profile = dm.profile_column(series, approximate=True)
+    low, high = profile['error_bounds']['unique_values']
+    assert low <= 50000 <= high
+    assert low < high
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('file_name', ['sample_input.xlsx', 'mapped_output.xlsx'])
+@pytest.mark.parametrize('chunk_size', [1, 5])
+def test_streaming_profile_matches_whole_file(file_name, chunk_size):
+    input_file = os.path.join(REPO_DIR, file_name)
+    whole = dm.analyze_data_structure(input_file)
+    streamed = dm.analyze_data_structure(input_file, chunk_size=chunk_size)
+    for column, column_info in whole['columns'].items():
+        assert streamed['columns'][column]['data_type'] == column_info['data_type'], column
+        assert streamed['columns'][column]['patterns'] == column_info['patterns'], column
+    assert streamed['suggested_mappings'] == whole['suggested_mappings']
+
+
+def test_pattern_flags_only_cover_object_columns():
+    frame = pd.DataFrame({'email': ['a@b.com', 'c@d.org']})
+    as_object = dm.analyze_data_structure(frame.astype(object))
+    assert as_object['columns']['email']['patterns']['has_email']
+    assert as_object['suggested_mappings']['email'] == 'extract_domain or before_at'
+    # As in the original detect_patterns, other dtypes (pandas 3 str included) get no flags
+    as_string = dm.analyze_data_structure(frame.astype('string'))
+    assert not any(as_string['columns']['email']['patterns'].values())
+    assert as_string['suggested_mappings']['email'] == 'direct'
+
+
+def test_pattern_library_reports_a_ratio_per_pattern():
+    series = pd.Series(['a@b.com', '2024-01-05', '+1 (555) 123-4567', '12345',
+                        '123e4567-e89b-12d3-a456-426614174000', '$1,200.50', 'DE', None, 'plain', 'a@b.com'])
+    ratios = dm.pattern_match_ratios(series)
+    assert list(ratios) == list(dm.PATTERN_LIBRARY)
+    # Nine non-missing values, two of them emails
+    assert ratios == pytest.approx({'email': 2 / 9, 'date': 1 / 9, 'phone': 1 / 9, 'postal_code': 1 / 9,
+                                    'uuid': 1 / 9, 'currency_amount': 1 / 9, 'country_code': 1 / 9})
+
+
+def test_phone_numbers_in_customer_output():
+    analysis = dm.analyze_data_structure(os.path.join(REPO_DIR, 'cust_output.xlsx'))
+    ratios = analysis['columns']['Cust_phone_number']['pattern_ratios']
+    assert ratios['phone'] == 1.0
+    assert sum(ratios.values()) == 1.0
+    assert analysis['columns']['Cust_number']['pattern_ratios']['phone'] == 0.0
+
+
+def test_registered_patterns_share_the_single_scan(monkeypatch):
+    monkeypatch.setattr(dm, 'PATTERN_LIBRARY', dict(dm.PATTERN_LIBRARY))
+    monkeypatch.setattr(dm, '_combined_pattern', None)
+    dm.register_pattern('ticket', r'TCK-\d{4}', ignore_case=True)
+
+    scans = []
+    pattern_texts = dm._pattern_texts
+    monkeypatch.setattr(dm, '_pattern_texts', lambda distinct: scans.append(len(distinct)) or pattern_texts(distinct))
+    ratios = dm.pattern_match_ratios(pd.Series(['TCK-0001', 'tck-0002', 'TCK-0001', 'other']))
+    assert ratios['ticket'] == 0.75
+    assert ratios['email'] == 0.0
+    # Distinct values go through the combined regex once, whatever the number of patterns
+    assert scans == [3]
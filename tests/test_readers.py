@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+
+@pytest.mark.parametrize('header', [
+    ['a', 'a', 'b', 'a', 'a.1', None, None, 'Unnamed: 5'],
+    ['x', 'x.1', 'x', 'x', 2020, 2020, '2020.1'],
+])
+def test_excel_chunks_dedupe_headers_like_read_excel(tmp_path, header):
+    input_file = str(tmp_path / 'duplicates.xlsx')
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(header)
+    for start in (0, 10, 20):
+        worksheet.append(list(range(start, start + len(header))))
+    workbook.save(input_file)
+
+    expected = pd.read_excel(input_file)
+    chunks = list(dm.read_excel_chunks(input_file, chunk_size=2))
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected, check_dtype=False)
+
+    selected = next(dm.read_excel_chunks(input_file, chunk_size=5, columns=[expected.columns[1]]))
+    assert list(selected.columns) == [expected.columns[1]]
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INPUT = os.path.join(REPO_DIR, 'sample_input.xlsx')
+MAPPING_RULES = os.path.join(REPO_DIR, 'mapping_rules.xlsx')
+
+
+@pytest.fixture(params=['xlsx', 'parquet', 'feather', 'csv', 'csv.gz'])
+def wide_input(request, tmp_path):
+    pytest.importorskip('pyarrow')
+    data = pd.read_excel(SAMPLE_INPUT)
+    # Columns the mapping never refers to
+    for i in range(20):
+        data[f'unused_{i}'] = range(len(data))
+    input_file = str(tmp_path / f'wide.{request.param}')
+    dm.write_output(data, input_file)
+    return input_file
+
+
+def test_inputs_read_only_requested_columns(wide_input):
+    columns = ['email', 'age']
+    data = dm.read_input(wide_input, columns=columns)
+    assert sorted(data.columns) == sorted(columns)
+    assert len(data) == 12
+
+    chunks = list(dm.read_input_chunks(wide_input, chunk_size=5, columns=columns))
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    pd.testing.assert_frame_equal(pd.concat(chunks), data, check_dtype=False)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 5])
+def test_mapping_reads_only_source_fields(wide_input, tmp_path, monkeypatch, chunk_size):
+    read_columns = []
+    for name in ('read_input', 'read_input_chunks'):
+        reader = getattr(dm, name)
+
+        def spy(file_path, *args, reader=reader, **kwargs):
+            read_columns.append(kwargs.get('columns'))
+            return reader(file_path, *args, **kwargs)
+        monkeypatch.setattr(dm, name, spy)
+
+    plan = dm.compile_mapping_plan(MAPPING_RULES)
+    output_file = str(tmp_path / 'output.parquet')
+    dm.perform_data_mapping(wide_input, plan, output_file, chunk_size=chunk_size)
+    assert read_columns == [plan.source_fields]
+
+    expected_file = str(tmp_path / 'expected.parquet')
+    dm.perform_data_mapping(SAMPLE_INPUT, plan, expected_file)
+    pd.testing.assert_frame_equal(pd.read_parquet(output_file), pd.read_parquet(expected_file), check_dtype=False)
+
+
+def test_analysis_reads_only_requested_columns(wide_input):
+    analysis = dm.analyze_data_structure(wide_input, columns=['first_name', 'age'])
+    assert sorted(analysis['columns']) == ['age', 'first_name']
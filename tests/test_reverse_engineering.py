@@ -0,0 +1,161 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INPUT = os.path.join(REPO_DIR, 'sample_input.xlsx')
+MAPPED_OUTPUT = os.path.join(REPO_DIR, 'mapped_output.xlsx')
+CUST_OUTPUT = os.path.join(REPO_DIR, 'cust_output.xlsx')
+
+
+@pytest.fixture(scope='module')
+def analyses():
+    return dm.analyze_data_structure(SAMPLE_INPUT), dm.analyze_data_structure(MAPPED_OUTPUT)
+
+
+@pytest.mark.parametrize('top_k', [1, 2])
+def test_unverified_targets_fall_back_to_dtype_family(analyses, top_k):
+    input_analysis, target_analysis = analyses
+    suggestions = dm.reverse_engineer_mapping(input_analysis, target_analysis, top_k=top_k)
+    counts = suggestions['target_field'].value_counts()
+    assert set(counts.index) == set(target_analysis['columns'])
+    assert (counts <= top_k).all()
+    for target in ('SHORT_NAME', 'INITIALS', 'EMAIL_USERNAME', 'AGE_GROUP'):
+        sources = suggestions.loc[suggestions['target_field'] == target, 'source_field']
+        assert all(input_analysis['columns'][source]['data_type'] == target_analysis['columns'][target]['data_type']
+                   for source in sources)
+
+
+def test_join_key_aligns_shuffled_and_filtered_targets(monkeypatch):
+    source = pd.read_excel(MAPPED_OUTPUT)
+    target = pd.read_excel(CUST_OUTPUT).sample(frac=1, random_state=3).iloc[:8].reset_index(drop=True)
+    assert dm.infer_join_key(source, target) == ('Emp_Id', 'Cust_number')
+
+    scans = []
+    iter_frames = dm._iter_frames
+    monkeypatch.setattr(dm, '_iter_frames', lambda *args, **kwargs: scans.append(args) or iter_frames(*args, **kwargs))
+    source_rows, target_rows, key = dm.align_samples(source, target)
+    assert key == ('Emp_Id', 'Cust_number')
+    assert len(scans) == 1
+    assert source_rows['Emp_Id'].tolist() == target_rows['Cust_number'].tolist() == target['Cust_number'].tolist()
+    assert source_rows['FULL_NAME'].tolist() == target_rows['Cust_NAME'].tolist()
+
+    suggestions = dm.reverse_engineer_mapping(source, target, top_k=1)
+    name = suggestions[suggestions['target_field'] == 'Cust_NAME'].iloc[0]
+    assert (name['source_field'], name['transform_rule'], name['confidence']) == ('FULL_NAME', 'direct', 1.0)
+    assert suggestions.attrs['join_key'] == ('Emp_Id', 'Cust_number')
+
+
+def test_alignment_falls_back_to_positions():
+    source = pd.read_excel(SAMPLE_INPUT)
+    target = pd.read_excel(CUST_OUTPUT)
+    assert dm.infer_join_key(source, target) is None
+    source_rows, target_rows, key = dm.align_samples(source, target)
+    assert key is None and len(source_rows) == len(target_rows) == len(source)
+
+
+def _assert_same_analysis(analysis, expected):
+    """MinHash signatures are arrays, so they are compared apart from the rest"""
+    assert analysis.keys() == expected.keys()
+    assert analysis['columns'].keys() == expected['columns'].keys()
+    for column, column_info in expected['columns'].items():
+        other = analysis['columns'][column]
+        assert {key: value for key, value in other.items() if key != 'minhash'} == \
+            {key: value for key, value in column_info.items() if key != 'minhash'}, column
+        assert np.array_equal(other.get('minhash'), column_info.get('minhash')), column
+
+
+def test_loaded_data_and_analyses_match_files(analyses):
+    expected = dm.reverse_engineer_mapping(SAMPLE_INPUT, MAPPED_OUTPUT)
+    loaded = dm.reverse_engineer_mapping(pd.read_excel(SAMPLE_INPUT), pd.read_excel(MAPPED_OUTPUT))
+    pd.testing.assert_frame_equal(loaded, expected)
+
+    input_analysis, target_analysis = analyses
+    _assert_same_analysis(dm.analyze_data_structure(pd.read_excel(SAMPLE_INPUT)), input_analysis)
+    from_analyses = dm.reverse_engineer_mapping(input_analysis, target_analysis)
+    pd.testing.assert_frame_equal(from_analyses, dm.reverse_engineer_mapping(SAMPLE_INPUT, MAPPED_OUTPUT, verify=False))
+
+
+def test_analysis_cache_is_keyed_by_content(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    input_file = str(tmp_path / 'input.csv')
+    pd.read_excel(SAMPLE_INPUT).to_csv(input_file, index=False)
+    expected = dm.analyze_data_structure(input_file, cache_dir=cache_dir)
+
+    reads = []
+    read_input = dm.read_input
+    monkeypatch.setattr(dm, 'read_input', lambda *args, **kwargs: reads.append(args) or read_input(*args, **kwargs))
+    # Same content under another name and modification time is still a hit
+    copied_file = str(tmp_path / 'copy.csv')
+    with open(input_file, 'rb') as source, open(copied_file, 'wb') as copy:
+        copy.write(source.read())
+    _assert_same_analysis(dm.analyze_data_structure(copied_file, cache_dir=cache_dir), expected)
+    assert reads == []
+
+    # Other options or columns are separate entries
+    dm.analyze_data_structure(input_file, cache_dir=cache_dir, columns=['age'])
+    assert len(reads) == 1
+
+    pd.read_excel(SAMPLE_INPUT).iloc[:5].to_csv(input_file, index=False)
+    changed = dm.analyze_data_structure(input_file, cache_dir=cache_dir)
+    assert len(reads) == 2
+    assert changed['columns']['email']['unique_values'] == 5
+
+
+def test_verification_picks_the_rule_that_reproduces_the_target():
+    suggestions = dm.reverse_engineer_mapping(SAMPLE_INPUT, MAPPED_OUTPUT, top_k=None)
+    best = suggestions.drop_duplicates('target_field').set_index('target_field')
+    for target, source, rule in [('FIRST_NAME', 'first_name', 'uppercase'),
+                                 ('SHORT_NAME', 'first_name', 'first_three_chars'),
+                                 ('AGE_GROUP', 'age', 'age_category'),
+                                 ('EMAIL_USERNAME', 'email', 'before_at'),
+                                 ('INITIALS', 'first_name', 'first_letter')]:
+        assert (best.loc[target, 'source_field'], best.loc[target, 'transform_rule']) == (source, rule), target
+        assert best.loc[target, 'confidence'] == 1.0
+    # Every other candidate for the target agrees less with it
+    others = suggestions[(suggestions['target_field'] == 'FIRST_NAME') & (suggestions['transform_rule'] != 'uppercase')]
+    assert (others['confidence'] < 1.0).all()
+
+
+def test_suggested_rules_are_valid_and_reproduce_the_target():
+    suggestions = dm.reverse_engineer_mapping(SAMPLE_INPUT, MAPPED_OUTPUT, top_k=1)
+    rules = suggestions['transform_rule']
+    assert rules.isin(list(dm.TRANSFORMS) + ['']).all()
+
+    verified = suggestions[suggestions['confidence'] == 1.0]
+    plan = dm.compile_mapping_plan(verified[['source_field', 'target_field', 'transform_rule']])
+    output = plan.apply(pd.read_excel(SAMPLE_INPUT))
+    target = pd.read_excel(MAPPED_OUTPUT)
+    for column in plan.target_fields:
+        assert output[column].astype(object).tolist() == target[column].astype(object).tolist(), column
+
+
+def test_verification_runs_on_a_bounded_sample(monkeypatch):
+    source = pd.concat([pd.read_excel(SAMPLE_INPUT)] * 200, ignore_index=True)
+    target = dm.compile_mapping_plan(pd.DataFrame(
+        [('first_name', 'INITIALS', 'first_letter'), ('email', 'EMAIL_USERNAME', 'before_at')],
+        columns=['source_field', 'target_field', 'transform_rule'])).apply(source)
+
+    sample_rows = []
+    rule_outputs = dm._rule_outputs
+    monkeypatch.setattr(dm, '_rule_outputs', lambda sample: sample_rows.append(len(sample)) or rule_outputs(sample))
+    suggestions = dm.reverse_engineer_mapping(source, target, top_k=1).set_index('target_field')
+    # One batch of transforms for every candidate pair, on at most VERIFY_SAMPLE_SIZE rows
+    assert sample_rows == [dm.VERIFY_SAMPLE_SIZE]
+    assert suggestions.loc['INITIALS', 'transform_rule'] == 'first_letter'
+    assert suggestions.loc['EMAIL_USERNAME', 'transform_rule'] == 'before_at'
+
+
+def test_registered_transforms_are_verified(monkeypatch):
+    monkeypatch.setitem(dm.TRANSFORMS, 'reversed', dm.Transform('reversed', lambda series: series.str[::-1], 'text'))
+    source = pd.read_excel(SAMPLE_INPUT)
+    target = pd.DataFrame({'EMAN': source['first_name'].str[::-1]})
+    suggestions = dm.reverse_engineer_mapping(source, target, top_k=1)
+    assert suggestions[['source_field', 'transform_rule', 'confidence']].values.tolist() == [['first_name', 'reversed', 1.0]]
@@ -0,0 +1,120 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+import excel_to_pyspark_df as es
+from test_backends import EDGE_INPUT, EDGE_RULES, MAPPING_RULES, SAMPLE_INPUT
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+
+def _workbook(path, rows, header=('id', 'notes', 'late')):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(list(header))
+    for row in rows:
+        worksheet.append(list(row))
+    workbook.save(path)
+    return path
+
+
+def test_conversion_streams_past_blank_columns(tmp_path, monkeypatch):
+    rows = [(index, None, 'x' if index == 7 else None) for index in range(10)]
+    excel_file = _workbook(str(tmp_path / 'notes.xlsx'), rows)
+    converted = []
+    write_table = pq.write_table
+
+    def tracking_write(table, path, *args, **kwargs):
+        converted.append(os.path.basename(path))
+        return write_table(table, path, *args, **kwargs)
+
+    monkeypatch.setattr(pq, 'write_table', tracking_write)
+    parts = es.convert_excel_to_parquet(excel_file, str(tmp_path / 'converted'), rows_per_partition=2)
+    # Parts are written as the sheet is read; the late values rewrite the earlier ones
+    assert converted[:3] == ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet']
+    assert len(parts) == 5
+    schemas = {pq.read_schema(part).remove_metadata() for part in parts}
+    assert len(schemas) == 1
+    schema = schemas.pop()
+    assert all(pa.types.is_string(schema.field(name).type) or pa.types.is_large_string(schema.field(name).type)
+               for name in ('notes', 'late'))
+    output = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+    assert output['id'].tolist() == list(range(10))
+    assert output['late'].dropna().tolist() == ['x']
+
+
+def test_stale_conversions_are_scoped_to_the_workbook_path(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    os.makedirs(cache_dir)
+    converted = {}
+    for region in ('east', 'west'):
+        os.makedirs(tmp_path / region)
+        excel_file = _workbook(str(tmp_path / region / 'customers.xlsx'), [(1, region, None)])
+        parquet_dir = es._excel_parquet_dir(excel_file, 0, 10, cache_dir)
+        es.convert_excel_to_parquet(excel_file, parquet_dir, rows_per_partition=10)
+        es._remove_stale_conversions(cache_dir, excel_file, 0, 10, keep=parquet_dir)
+        converted[region] = parquet_dir
+    assert converted['east'] != converted['west']
+    assert all(os.path.exists(parquet_dir) for parquet_dir in converted.values())
+
+    excel_file = _workbook(str(tmp_path / 'west' / 'customers.xlsx'), [(2, 'west', None)])
+    parquet_dir = es._excel_parquet_dir(excel_file, 0, 10, cache_dir)
+    es.convert_excel_to_parquet(excel_file, parquet_dir, rows_per_partition=10)
+    es._remove_stale_conversions(cache_dir, excel_file, 0, 10, keep=parquet_dir)
+    assert os.path.exists(converted['east']) and not os.path.exists(converted['west'])
+
+
+@pytest.fixture(scope='module')
+def spark():
+    pytest.importorskip('pyspark')
+    if not (os.environ.get('JAVA_HOME') or shutil.which('java')):
+        pytest.skip('Spark needs a Java runtime')
+    session = es.get_spark_session(master='local[1]')
+    session.sparkContext.setLogLevel('ERROR')
+    return session
+
+
+def _spark_mismatches(spark, input_file, mapping):
+    plan = dm.compile_mapping_plan(mapping)
+    expected = plan.apply(dm.read_input(input_file, columns=plan.source_fields)).reset_index(drop=True)
+    output = es.map_spark_df(es.read_spark_input(spark, input_file), plan).toPandas()
+    mismatches = {}
+    for target_field in plan.target_fields:
+        reference, mapped = expected[target_field].astype(object), output[target_field].astype(object)
+        different = ~((reference.isna() & mapped.isna()) | (reference == mapped).fillna(False).astype(bool))
+        if different.any():
+            mismatches[target_field] = list(zip(reference[different], mapped[different]))
+    return mismatches
+
+
+def test_spark_mapping_matches_pandas_on_fixture(spark, tmp_path):
+    input_file = str(tmp_path / 'sample.parquet')
+    dm.write_output(pd.read_excel(SAMPLE_INPUT), input_file)
+    assert _spark_mismatches(spark, input_file, MAPPING_RULES) == {}
+
+
+def test_spark_mapping_matches_pandas_on_edge_rules(spark, tmp_path):
+    input_file = str(tmp_path / 'edge.parquet')
+    dm.write_output(EDGE_INPUT, input_file)
+    mismatches = _spark_mismatches(spark, input_file, EDGE_RULES)
+    # Spark upper-cases ß to SS like Python; pandas' Arrow-backed strings give ẞ
+    assert mismatches == {'A': [('ẞARA', 'SSARA')]}
+
+
+def test_spark_runs_transforms_without_spark_kernel(spark, tmp_path, monkeypatch):
+    # Spark workers unpickle the transform, so it must be importable there: reuse data_mapper's functions
+    for name in ('uppercase', 'first_three_chars'):
+        monkeypatch.setitem(dm.TRANSFORMS, f'{name}_udf', dm.Transform(f'{name}_udf', dm.TRANSFORMS[name].vectorized, 'text'))
+    input_file = str(tmp_path / 'edge.parquet')
+    dm.write_output(EDGE_INPUT, input_file)
+    rules = pd.DataFrame([('last_name', 'A', 'uppercase_udf'), ('age', 'B', 'first_three_chars_udf')],
+                         columns=['source_field', 'target_field', 'transform_rule'])
+    assert _spark_mismatches(spark, input_file, rules) == {}
@@ -0,0 +1,116 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_mapper as dm
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+
+def _read(output_file):
+    return pd.read_parquet(output_file) if output_file.endswith('.parquet') else pd.read_feather(output_file)
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'feather'])
+def test_empty_column_does_not_hold_back_chunks(tmp_path, extension):
+    output_file = str(tmp_path / f'output.{extension}')
+    written = []
+
+    def chunks():
+        for start in range(0, 40, 2):
+            # Each chunk is only read once the previous one reached the file
+            written.append(os.path.exists(output_file))
+            yield pd.DataFrame({'id': [start, start + 1], 'notes': [None, None]})
+
+    dm.write_output_chunks(chunks(), output_file)
+    assert written[0] is False and all(written[1:])
+    output = _read(output_file)
+    assert output['id'].tolist() == list(range(40))
+    assert output['notes'].isna().all()
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'feather'])
+def test_late_values_retype_earlier_rows(tmp_path, extension):
+    output_file = str(tmp_path / f'output.{extension}')
+    chunks = [
+        pd.DataFrame({'id': [1, 2], 'late': [np.nan, np.nan], 'group': [None, None]}),
+        pd.DataFrame({'id': [3, 4], 'late': ['x', None], 'group': pd.Categorical(['u', 'v'])}),
+        pd.DataFrame({'id': [5.5, 6], 'late': ['y', 'z'], 'group': pd.Categorical(['u', 'u'])}),
+    ]
+    dm.write_output_chunks(iter(chunks), output_file)
+    output = _read(output_file)
+    assert output['id'].tolist() == [1, 2, 3, 4, 5.5, 6]
+    assert output['late'].isna().tolist() == [True, True, False, True, False, False]
+    assert output['late'].dropna().tolist() == ['x', 'y', 'z']
+    assert output['group'].iloc[:2].isna().all()
+    assert output['group'].iloc[2:].astype(object).tolist() == ['u', 'v', 'u', 'u']
+    if extension == 'parquet':
+        assert pa.types.is_dictionary(pq.read_schema(output_file).field('group').type)
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'polars'])
+@pytest.mark.parametrize('parallel', [None, 'rows'])
+def test_open_categoricals_are_decided_once_per_run(tmp_path, monkeypatch, backend, parallel):
+    if backend == 'polars' and parallel is not None:
+        pytest.skip('parallel applies to the pandas backend')
+    pytest.importorskip(backend)
+    input_file = str(tmp_path / 'input.parquet')
+    # Repeated initials first, then all different ones
+    dm.write_output(pd.DataFrame({'name': ['Ann', 'Amy', 'Bob', 'Cid', 'Dan', 'Eve']}), input_file)
+    rules = pd.DataFrame([('name', 'INITIALS', 'first_letter')], columns=['source_field', 'target_field', 'transform_rule'])
+    dtypes = []
+    write_output_chunks = dm.write_output_chunks
+
+    def recording_writer(chunks, *args, **kwargs):
+        def record():
+            for chunk in chunks:
+                dtypes.append(chunk['INITIALS'].dtype)
+                yield chunk
+        return write_output_chunks(record(), *args, **kwargs)
+
+    monkeypatch.setattr(dm, 'write_output_chunks', recording_writer)
+    output_file = str(tmp_path / 'output.parquet')
+    dm.perform_data_mapping(input_file, rules, output_file, chunk_size=2, parallel=parallel, max_workers=1,
+                            backend=backend)
+    assert len(dtypes) == 3
+    assert all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes)
+    assert pd.read_parquet(output_file)['INITIALS'].astype(object).tolist() == list('AABCDE')
+
+
+def _sheet_rows(excel_file):
+    from openpyxl import load_workbook
+    workbook = load_workbook(excel_file, read_only=True)
+    rows = [list(row) for row in workbook.active.iter_rows(values_only=True)]
+    workbook.close()
+    return rows
+
+
+def test_excel_chunks_match_to_excel(tmp_path):
+    data = pd.DataFrame({
+        'name': ['Ann', None, 'Bob', 'Cy', '', 'Dee', 'Ed'],
+        'age': [29, 45, 12, 80, 33, 51, 7],
+        'score': [1.5, np.nan, 2.0, 3.25, None, 0.0, -1.0],
+        'group': pd.Categorical(['a', 'b', None, 'a', 'b', 'a', 'b']),
+        'flag': [True, False, True, True, False, False, True],
+    })
+    expected_file = str(tmp_path / 'expected.xlsx')
+    data.to_excel(expected_file, index=False, engine='openpyxl')
+
+    output_file = str(tmp_path / 'output.xlsx')
+    consumed = []
+
+    def chunks():
+        for start in range(0, len(data), 3):
+            consumed.append(start)
+            yield data.iloc[start:start + 3]
+
+    dm.write_excel_chunks(chunks(), output_file, sheet_name='Sheet1')
+    assert consumed == [0, 3, 6]
+    assert _sheet_rows(output_file) == _sheet_rows(expected_file)
+    pd.testing.assert_frame_equal(pd.read_excel(output_file), pd.read_excel(expected_file))